@@ -1,51 +1,47 @@
-from tensorforce.environments import Environment
+import numpy as np
+from ffxivdps import BLM
 
-class BlmEnvironment(Environment):
+class BlmEnvironment:
+    """tensorforce's Environment interface over ffxivdps.BLM, without the base class so
+    worker processes can step it without importing tensorforce.
 
-    def __init__(self):
-        # Constants
-        self.__Umbral3 = 3
-        self.__Umbral2 = 2
-        self.__Umbral1 = 1
-        self.__None = 0
-        self.__Astral3 = 6
-        self.__Astral2 = 5
-        self.__Astral1 = 4
+    The state is BLM's own vector (ability cooldowns, mana, Astral/Umbral) as floats, the
+    same input DQNBLM's Brain sees, and the actions are BLM's abilities. Rewards are BLM's
+    potencies, so episode rewards compare directly with DQNBLM's."""
 
-        # Abilities
-        self.abilities = [50, 100]
+    def __init__(self, maxUmbralAstral=3, maxTime=None, job="blm"):
+        self.env = BLM.BLM(maxUmbralAstral, job)
+        if maxTime is not None:
+            self.env.MAXTIME = maxTime
+        self.abilities = [ability.name for ability in self.env.ABILITIES]
 
         # Stateful
         self.damageDone = 0
+        self.steps = 0
 
     def __str__(self):
-        return "This is __str__ for BlmEnvironment"
+        return "BlmEnvironment(%d, %ss)" % (self.env.maxUmbralAstral, self.env.MAXTIME)
 
     def close(self):
         return
 
     def reset(self):
         self.damageDone = 0
+        self.steps = 0
+        return self.env._reset().astype(np.float32)
 
     def execute(self, action):
-        reward = self.abilities[action]
-        return tuple(tuple(1.0, self.__None), reward, False)
+        state, reward, done, info = self.env._step(int(action))
+        self.damageDone += reward
+        self.steps += 1
+        return state.astype(np.float32), reward, done
 
     @property
     def states(self):
-        # tuple(box(1), discrete(7), discrete(2) * #ofSpells, discrete(2) * #ofBuffs
-        # mp, astral+umbral, CDs, status
-        stateDict = dict()
-
-        # mp = box(1)
-        stateDict['state{}'.format(0)] = dict(shape=(1), type='float')
-
-        # astral+umbral = discrete(7)
-        stateDict['state{}'.format(1)] = dict(shape=(), type='int')
-
-        return stateDict
+        # cooldowns * #ofAbilities, mp, astral+umbral
+        return dict(shape=(len(self.env.initialState),), type='float')
 
     @property
     def actions(self):
-		# discrete(len(self.abilities)
-        return dict(continuous=False, num_actions=len(self.abilities))
\ No newline at end of file
+        # discrete(len(self.abilities))
+        return dict(continuous=False, num_actions=len(self.abilities))
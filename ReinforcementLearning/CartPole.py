@@ -1,11 +1,10 @@
-from tensorforce.config import Configuration
-from tensorforce.contrib.openai_gym import OpenAIGym
-from tensorforce.agents import DQNAgent
-from tensorforce.execution import Runner
-
-
-
 def main():
+    # tensorforce is only imported when the example runs
+    from tensorforce.config import Configuration
+    from tensorforce.contrib.openai_gym import OpenAIGym
+    from tensorforce.agents import DQNAgent
+    from tensorforce.execution import Runner
+
     gym_id = 'CartPole-v0'
     max_episodes = 10000
     max_timesteps = 1000
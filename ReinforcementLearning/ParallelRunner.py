@@ -0,0 +1,151 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import multiprocessing as mp
+import queue
+import time
+import numpy as np
+from ReinforcementLearning.BlmEnvironment import BlmEnvironment
+
+AGENTS = ("random", "dqn", "ppo")
+
+# Workers send finished episodes batched until at least this many steps
+CHUNK_STEPS = 4096
+
+class RandomAgent:
+    """ Uniformly random abilities, the reward floor and env throughput ceiling without tensorforce """
+
+    def __init__(self, actionCount, seed=None):
+        self.actionCount = actionCount
+        self.random = np.random.RandomState(seed)
+
+    def act(self, state):
+        return self.random.randint(self.actionCount)
+
+    def observe(self, reward, terminal):
+        pass
+
+def makeAgent(name, env, seed=None):
+    """ A fresh agent for env by name, tensorforce is only imported for its agents """
+    if name == "random":
+        return RandomAgent(len(env.abilities), seed)
+
+    from tensorforce import Configuration
+    from tensorforce.agents import DQNAgent, PPOAgent
+    from tensorforce.core.networks import layered_network_builder
+
+    network = layered_network_builder([dict(type='dense', size=32)])
+    if name == "dqn":
+        # DQNBLM's replay settings, so the two learners see the same amount of data
+        return DQNAgent(Configuration(log_level='info', memory_capacity=100000, batch_size=32, discount=0.95, learning_rate=0.001,
+                                      states=env.states, actions=env.actions, network=network))
+    if name == "ppo":
+        return PPOAgent(config=Configuration(log_level='info', batch_size=4096, gae_lambda=0.97, learning_rate=0.001, entropy_penalty=0.01,
+                                             epochs=5, optimizer_batch_size=512, loss_clipping=0.2,
+                                             states=env.states, actions=env.actions, network=network))
+    raise ValueError("Unknown agent %r, expected one of %s" % (name, ", ".join(AGENTS)))
+
+def worker(index, agentName, episodes, maxUmbralAstral, maxTime, seed, results, stop):
+    """ Trains its own agent on its own BlmEnvironment, sending (index, chunk of (reward, steps) per episode) and (index, None) when done """
+    env = BlmEnvironment(maxUmbralAstral, maxTime)
+    agent = makeAgent(agentName, env, seed + index)
+    chunk, chunkSteps = [], 0
+    try:
+        for episode in range(episodes):
+            if stop.is_set():
+                break
+            state = env.reset()
+            while True:
+                state, reward, terminal = env.execute(agent.act(state))
+                agent.observe(reward=reward, terminal=terminal)
+                if terminal:
+                    break
+            chunk.append((env.damageDone, env.steps))
+            chunkSteps += env.steps
+            if chunkSteps >= CHUNK_STEPS:
+                results.put((index, chunk))
+                chunk, chunkSteps = [], 0
+    finally:
+        env.close()
+        if chunk:
+            results.put((index, chunk))
+        results.put((index, None))
+
+def train(agentName, workerCount, episodes, maxUmbralAstral=3, maxTime=None, seed=0, verbose=True):
+    """Runs episodes split across workerCount processes, each training an independent agent.
+
+    Returns env steps per second over all workers, and per worker the seconds until its own
+    rolling average reached DQNBLM.REWARD_TARGET (None if it never did) and its episode
+    rewards. Each worker is a learner on its own, so its time to target is what compares with
+    DQNBLM's single learner. tensorforce 0.2 agents act on one state at a time and expect the
+    steps they observe to be one episode in order, so one agent can't batch over envs the way
+    ActorLearner's learner does, and these numbers don't compare with ActorLearner's."""
+    from ffxivdps import DQNBLM
+
+    results = mp.Queue()
+    stop = mp.Event()
+    perWorker = -(-episodes // workerCount)
+    workers = [mp.Process(target=worker, args=(i, agentName, perWorker, maxUmbralAstral, maxTime, seed, results, stop)) for i in range(workerCount)]
+    for p in workers:
+        p.daemon = True
+        p.start()
+
+    startTime = time.time()
+    steps = 0
+    rewards = [[] for i in range(workerCount)]
+    timesToTarget = [None] * workerCount
+    running = workerCount
+    try:
+        while running:
+            try:
+                index, chunk = results.get(timeout=1)
+            except queue.Empty:
+                if not any(p.is_alive() for p in workers):
+                    break
+                continue
+            if chunk is None:
+                running -= 1
+                continue
+
+            workerRewards = rewards[index]
+            for reward, episodeSteps in chunk:
+                steps += episodeSteps
+                workerRewards.append(reward)
+                window = workerRewards[-DQNBLM.BATCH_SIZE_BASELINE:]
+                if timesToTarget[index] is None and len(window) == DQNBLM.BATCH_SIZE_BASELINE and np.mean(window) >= DQNBLM.REWARD_TARGET:
+                    timesToTarget[index] = time.time() - startTime
+                if verbose and len(workerRewards) % DQNBLM.BATCH_SIZE_BASELINE == 0:
+                    print('Worker: %d, ep: %d, avg reward: %f, steps/s: %f' % (index, len(workerRewards), np.mean(window), steps / (time.time() - startTime)))
+    finally:
+        stop.set()
+        # Drain so workers blocked flushing their last chunks can exit
+        while any(p.is_alive() for p in workers):
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for p in workers:
+            p.join()
+
+    return steps / (time.time() - startTime), timesToTarget, rewards
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train tensorforce agents on BlmEnvironment in parallel worker processes")
+    parser.add_argument("--agent", choices=AGENTS, default="dqn")
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts to compare")
+    parser.add_argument("--episodes", type=int, default=2000, help="total over all workers")
+    parser.add_argument("--max-umbral-astral", type=int, default=3)
+    parser.add_argument("--max-time", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for count in [int(c) for c in args.workers.split(",")]:
+        stepsPerSecond, timesToTarget, rewards = train(args.agent, count, args.episodes, args.max_umbral_astral, args.max_time, args.seed)
+        results.append((count, stepsPerSecond, timesToTarget, np.mean([np.mean(r[-100:]) for r in rewards if r])))
+
+    # One time to target per worker, each an independent learner, not comparable with ActorLearner's shared learner
+    print("Independent learners, total steps/s does not speed up any one of them")
+    print("workers  env-steps/s  last-100 reward  time-to-target per worker")
+    for count, stepsPerSecond, timesToTarget, reward in results:
+        print("%7d  %11.1f  %15.1f  %s" % (count, stepsPerSecond, reward, " ".join("-" if t is None else "%.1fs" % t for t in timesToTarget)))
@@ -0,0 +1,277 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import ctypes
+import multiprocessing as mp
+import time
+import numpy as np
+from . import BLM
+from .NumpyPolicy import NumpyPolicy, NAMES
+
+# Actors ship whole episodes, batched until at least this many steps
+CHUNK_STEPS = 256
+# Slots in each actor's transition ring, room for several chunks so actors rarely wait
+RING_SLOTS = 16 * CHUNK_STEPS
+
+class SharedWeights:
+    """Brain weights (W1, b1, W2, b2) in one shared float32 buffer with a version counter.
+
+    The learner publishes new weights, actors copy them when the version changes."""
+
+    def __init__(self, shapes):
+        self.shapes = shapes
+        self.sizes = [int(np.prod(shape)) for shape in shapes]
+        self.buffer = mp.Array("f", sum(self.sizes))
+        self.version = mp.Value("i", 0)
+
+    def publish(self, arrays):
+        with self.buffer.get_lock():
+            flat = np.frombuffer(self.buffer.get_obj(), dtype=np.float32)
+            flat[:] = np.concatenate([np.asarray(a, dtype=np.float32).ravel() for a in arrays])
+            self.version.value += 1
+
+    def fetch(self):
+        with self.buffer.get_lock():
+            flat = np.frombuffer(self.buffer.get_obj(), dtype=np.float32).copy()
+            version = self.version.value
+        arrays, offset = [], 0
+        for shape, size in zip(self.shapes, self.sizes):
+            arrays.append(flat[offset:offset + size].reshape(shape))
+            offset += size
+        return version, arrays
+
+class TransitionRing:
+    """One actor's transitions in shared memory, a single producer single consumer ring.
+
+    The actor writes whole chunks into free slots and then publishes them by advancing
+    written. The learner copies out everything up to written and frees it by advancing read.
+    Each slot holds (s, a, r, done) and, on the last step of an episode, its total reward.
+    Nothing is pickled on the way."""
+
+    def __init__(self, capacity, stateCount):
+        self.capacity = capacity
+        self.stateCount = stateCount
+        self.buffers = (mp.RawArray(ctypes.c_int16, capacity * stateCount), mp.RawArray(ctypes.c_int32, capacity),
+                        mp.RawArray(ctypes.c_float, capacity), mp.RawArray(ctypes.c_bool, capacity), mp.RawArray(ctypes.c_float, capacity))
+        # Totals ever written and read, the locks order the index updates after the slot copies
+        self.written = mp.Value("q", 0)
+        self.read = mp.Value("q", 0)
+        self._views()
+
+    def _views(self):
+        states, actions, rewards, dones, returns = self.buffers
+        self.states = np.frombuffer(states, dtype=np.int16).reshape(self.capacity, self.stateCount)
+        self.actions = np.frombuffer(actions, dtype=np.int32)
+        self.rewards = np.frombuffer(rewards, dtype=np.float32)
+        self.dones = np.frombuffer(dones, dtype=np.bool_)
+        self.returns = np.frombuffer(returns, dtype=np.float32)
+
+    def __getstate__(self):
+        # The NumPy views are rebuilt over the shared buffers in the child
+        return dict((name, getattr(self, name)) for name in ("capacity", "stateCount", "buffers", "written", "read"))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._views()
+
+    def write(self, states, actions, rewards, dones, returns, stop):
+        """ Publish a chunk once there is room for it, False if stop was set while waiting """
+        count = len(states)
+        assert count <= self.capacity, "Chunk larger than the ring"
+        with self.written.get_lock():
+            written = self.written.value
+        while written + count - self.read.value > self.capacity:
+            if stop.is_set():
+                return False
+            time.sleep(0.001)
+        slots = (written + np.arange(count)) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.dones[slots] = dones
+        self.returns[slots] = returns
+        with self.written.get_lock():
+            self.written.value = written + count
+        return True
+
+    def take(self):
+        """ Copies of every published transition not taken yet as (states, actions, rewards, dones, episode rewards), or None """
+        with self.written.get_lock():
+            written = self.written.value
+        read = self.read.value
+        if written == read:
+            return None
+        slots = (read + np.arange(written - read)) % self.capacity
+        dones = self.dones[slots]
+        chunk = (self.states[slots], self.actions[slots], self.rewards[slots], dones, self.returns[slots][dones].tolist())
+        with self.read.get_lock():
+            self.read.value = written
+        return chunk
+
+def actorEpsilon(i, count, base=0.4, alpha=7):
+    """ Fixed exploration per actor, spread from base down to base^(1 + alpha) (Ape-X schedule) """
+    return base ** (1 + alpha * i / max(1, count - 1))
+
+def actor(index, count, maxUmbralAstral, weights, ring, stop, seed):
+    """ Plays BLM episodes with a NumpyPolicy copy of the Brain and writes (s, a, r, done) chunks and episode rewards to its ring """
+    random = np.random.RandomState(seed + index)
+    epsilon = actorEpsilon(index, count)
+    env = BLM.BLM(maxUmbralAstral)
+    actionCount = len(env.ABILITIES)
+    version, arrays = weights.fetch()
+    policy = NumpyPolicy(*arrays)
+
+    states, actions, rewards, dones, returns = [], [], [], [], []
+    while not stop.is_set():
+        if weights.version.value != version:
+            version, arrays = weights.fetch()
+            policy = NumpyPolicy(*arrays)
+
+        s = env._reset().copy()
+        R = 0
+        while True:
+            if random.random_sample() < epsilon:
+                a = random.randint(actionCount)
+            else:
+                a = int(np.argmax(policy.forward(s)[0]))
+
+            s_, r, done, info = env._step(a)
+            states.append(s)
+            actions.append(a)
+            rewards.append(r)
+            dones.append(done)
+            R += r
+            returns.append(R)
+            s = s_.copy()
+
+            if done:
+                break
+
+        # Chunks end on an episode boundary so the learner's ring buffer keeps next states aligned
+        if len(states) >= CHUNK_STEPS:
+            if not ring.write(np.array(states, dtype=np.int16), actions, rewards, dones, returns, stop):
+                break
+            states, actions, rewards, dones, returns = [], [], [], [], []
+
+def startActors(actorCount, maxUmbralAstral, weights, stop, seed):
+    """ Starts actorCount actor processes, each with its own TransitionRing """
+    stateCount = len(BLM.BLM(maxUmbralAstral).initialState)
+    rings = [TransitionRing(RING_SLOTS, stateCount) for i in range(actorCount)]
+    actors = [mp.Process(target=actor, args=(i, actorCount, maxUmbralAstral, weights, rings[i], stop, seed)) for i in range(actorCount)]
+    for p in actors:
+        p.daemon = True
+        p.start()
+    return rings, actors
+
+def stopActors(actors, stop):
+    # Actors waiting for ring space see stop and exit without writing
+    stop.set()
+    for p in actors:
+        p.join()
+
+def poll(rings):
+    """ Every chunk published since the last poll, sleeping briefly when there are none """
+    chunks = [chunk for chunk in (ring.take() for ring in rings) if chunk is not None]
+    if not chunks:
+        time.sleep(0.001)
+    return chunks
+
+def train(actorCount, totalEpisodes=None, maxUmbralAstral=3, syncEvery=25, replaysPerStep=1, seed=0, verbose=True):
+    """Trains a DQNBLM.Agent from actorCount actor processes feeding one learner (this process).
+
+    Returns env steps per second, seconds until the rolling average reached REWARD_TARGET
+    (None if it never did) and the trained agent."""
+    from . import DQNBLM
+    if totalEpisodes is None:
+        totalEpisodes = DQNBLM.TOTAL_EPISODES
+
+    agent = DQNBLM.Agent()
+    params = agent.brain.params
+    names = NAMES
+    weights = SharedWeights([params[name].value.shape for name in names])
+    weights.publish([params[name].value for name in names])
+
+    stop = mp.Event()
+    rings, actors = startActors(actorCount, maxUmbralAstral, weights, stop, seed)
+
+    startTime = time.time()
+    steps = replays = episodes = pending = 0
+    window = []
+    timeToTarget = None
+    try:
+        while episodes < totalEpisodes:
+            for states, actions, rewards, dones, episodeRewards in poll(rings):
+                agent.memory.addBatch(states, actions, rewards, dones)
+                steps += len(states)
+
+                # Same cadence as DQNBLM.run, one replay per UPDATE_EVERY env steps
+                pending += len(states) * replaysPerStep
+                while pending >= DQNBLM.UPDATE_EVERY:
+                    pending -= DQNBLM.UPDATE_EVERY
+                    agent.replay()
+                    replays += 1
+                    if replays % syncEvery == 0:
+                        weights.publish([params[name].value for name in names])
+
+                for R in episodeRewards:
+                    episodes += 1
+                    window = (window + [R])[-DQNBLM.BATCH_SIZE_BASELINE:]
+                    if timeToTarget is None and len(window) == DQNBLM.BATCH_SIZE_BASELINE and np.mean(window) >= DQNBLM.REWARD_TARGET:
+                        timeToTarget = time.time() - startTime
+                    if verbose and episodes % DQNBLM.BATCH_SIZE_BASELINE == 0:
+                        print('Ep: %d, avg reward: %f, steps/s: %f' % (episodes, np.mean(window), steps / (time.time() - startTime)))
+    finally:
+        stopActors(actors, stop)
+
+    return steps / (time.time() - startTime), timeToTarget, agent
+
+def deliveryRate(actorCount, seconds=10, maxUmbralAstral=3, seed=0):
+    """Env steps per second that reach the learner's Memory from actorCount actors, without CNTK.
+
+    Actors play with fixed random Brain-shaped weights and the learner only stores what arrives,
+    so this is the ceiling train() can reach before replay takes its share of the learner."""
+    from . import DQNBLM
+    from .Memory import Memory
+    random = np.random.RandomState(seed)
+    hidden = int(DQNBLM.H)
+    shapes = [(DQNBLM.STATE_COUNT, hidden), (hidden,), (hidden, DQNBLM.ACTION_COUNT), (DQNBLM.ACTION_COUNT,)]
+    weights = SharedWeights(shapes)
+    weights.publish([random.normal(scale=0.1, size=shape) for shape in shapes])
+    memory = Memory(DQNBLM.MEMORY_CAPACITY, DQNBLM.STATE_COUNT, np.int16)
+
+    stop = mp.Event()
+    rings, actors = startActors(actorCount, maxUmbralAstral, weights, stop, seed)
+    steps = 0
+    startTime = time.time()
+    try:
+        while time.time() - startTime < seconds:
+            for states, actions, rewards, dones, episodeRewards in poll(rings):
+                memory.addBatch(states, actions, rewards, dones)
+                steps += len(states)
+    finally:
+        stopActors(actors, stop)
+    return steps / (time.time() - startTime)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Actor/learner DQN training on BLM")
+    parser.add_argument("--actors", default="1,2,4,8", help="comma separated actor counts to compare")
+    parser.add_argument("--episodes", type=int, default=None)
+    parser.add_argument("--sync-every", type=int, default=25, help="replays between weight broadcasts")
+    parser.add_argument("--delivery", type=float, default=None, metavar="SECONDS",
+                        help="only measure actor to learner throughput for this long, no CNTK needed")
+    args = parser.parse_args()
+
+    if args.delivery is not None:
+        print("actors  delivered-steps/s")
+        for count in [int(c) for c in args.actors.split(",")]:
+            print("%6d  %17.1f" % (count, deliveryRate(count, args.delivery)))
+        raise SystemExit
+
+    results = []
+    for count in [int(c) for c in args.actors.split(",")]:
+        stepsPerSecond, timeToTarget, agent = train(count, args.episodes, syncEvery=args.sync_every)
+        results.append((count, stepsPerSecond, timeToTarget))
+
+    print("actors  env-steps/s  time-to-target")
+    for count, stepsPerSecond, timeToTarget in results:
+        print("%6d  %11.1f  %s" % (count, stepsPerSecond, "-" if timeToTarget is None else "%.1fs" % timeToTarget))
@@ -0,0 +1,416 @@
+from enum import *
+import math
+import numpy as np
+from . import Job
+
+class BLM:
+	"""This class creates a pseudo environment for expressing BLM potency in FFXIV."""
+
+	class AstralUmbral(IntEnum):
+		Neutral = 0
+		ASTRAL_FIRE_1 = 1
+		ASTRAL_FIRE_2 = 2
+		ASTRAL_FIRE_3 = 3
+		UMBRAL_ICE_1 = -1
+		UMBRAL_ICE_2 = -2
+		UMBRAL_ICE_3 = -3
+
+		def isAstral(i):
+			return i == BLM.AstralUmbral.ASTRAL_FIRE_1.value or i == BLM.AstralUmbral.ASTRAL_FIRE_2 or i == BLM.AstralUmbral.ASTRAL_FIRE_3
+
+		def isUmbral(i):
+			return i == BLM.AstralUmbral.UMBRAL_ICE_1 or i == BLM.AstralUmbral.UMBRAL_ICE_2 or i == BLM.AstralUmbral.UMBRAL_ICE_3
+
+	
+	class Helper:
+
+		def GetMana(self, state):
+			return state[-2]
+
+		def SetMana(self, state, newMana):
+			state[-2] = newMana
+
+		def GetAstralUmbral(self, state):
+			return state[-1] # Astral/Umbral is the last state
+
+	def __init__(self, maxUmbralAstral, job="blm"):
+		# Print debug
+		self.debug = False
+
+		# Outer bound for Astral Fire and Umbral Ice
+		self.maxUmbralAstral = maxUmbralAstral
+
+		# Abilities and their mechanics come from a job spec, compiled to lookup tables
+		# indexed by [ability, Astral/Umbral + 3]. Kept per env, so envs of different jobs coexist
+		self.job = Job.load(job, maxUmbralAstral)
+		self.maxMana = self.job.maxMana
+		self.manaTickTiming = self.job.manaTick
+
+		# Available buffs
+		self.BUFFS = []
+
+		# Maximum time available
+		self.MAXTIME = self.job.maxTime
+
+		self.HELPER = BLM.Helper()
+
+		# Available abilities
+		self.ABILITIES = self.job.abilities
+		
+		# State including ability cooldowns, buff time remaining, mana, and Astral/Umbral
+		self.initialState = np.array([0] * (len(self.ABILITIES) + len(self.BUFFS)) + [self.maxMana] + [0])
+
+		self._loadTables()
+
+		self.state = self._reset()
+
+	# gym.Env's interface without the base class, so importing BLM does not import gym
+	def step(self, action):
+		return self._step(action)
+
+	def reset(self):
+		return self._reset()
+
+	@property
+	def action_space(self):
+		""" What the learner can pick between """
+		from gym import spaces
+		return spaces.Discrete(len(self.ABILITIES))
+
+	@property
+	def observation_space(self):
+		""" What the learner can see to make a choice (cooldowns and buffs) """
+		from gym import spaces
+		return spaces.MultiDiscrete([[0,180]] * (len(self.ABILITIES) + len(self.BUFFS)) + [[0, self.maxMana]] + [[-3,3]])
+
+	def _loadTables(self):
+		""" Take the job's compiled tables, so stepping only needs lookups """
+		for name in Job.TABLES:
+			setattr(self, name, getattr(self.job, name))
+		self.NEXTASTRALUMBRAL = self.NEXTASTRALUMBRAL.astype(self.initialState.dtype)
+		self.COOLDOWN = self.COOLDOWN.astype(self.initialState.dtype)
+
+		# Plain lists of the same tables for the scalar step, where NumPy scalars are slower
+		self._potency = self.POTENCY.tolist()
+		self._manaCost = self.MANACOST.tolist()
+		self._nextAstralUmbral = self.NEXTASTRALUMBRAL.tolist()
+		self._cooldown = self.COOLDOWN.tolist()
+		self._needsAstral = self.NEEDSASTRAL.tolist()
+		self._regen = self.REGEN.tolist()
+
+	def _reset(self):
+		""" Reset the environment for a fresh run """
+		self.timer = 0
+		self.nextManaTick = self.manaTickTiming - 0.1
+		self.state = self.initialState.copy()
+
+		if self.debug:
+			print("RESET: %d, %d" % (self.HELPER.GetMana(self.state), self.HELPER.GetAstralUmbral(self.state)))
+		return self.state
+
+	def _step(self, action):
+		assert 0 <= action < len(self.ABILITIES), "Invalid action!"
+
+		ability = self.ABILITIES[action]
+		state = self.state
+		mana = state[-2]
+		column = state[-1] + 3
+
+		# Can I cast it?
+		if state[action] > 0 or mana < self._manaCost[action][column]:
+			# Still on cooldown!
+			self.timer += 0.75
+			
+			# Mana regen during wait?
+			ticks = self._regenTicks(column) if self.timer > self.nextManaTick and column <= 3 else 0
+			
+			if self.debug:
+				print("On cooldown: %s" % ability.name)
+			return state, self.scaleResult(-100), self._isDone(), {"Name": ability.name, "Invalid": True, "ManaTicks": ticks}
+		elif self._needsAstral[action] and column <= 3:
+			self.timer += 0.75
+			return state, self.scaleResult(0), self._isDone(), {"Name": ability.name, "Invalid": True, "ManaTicks": 0}
+
+		# Increase the time
+		castTime = ability.castTime
+		self.timer += castTime
+
+		# Mana regen
+		ticks = self._regenTicks(column) if self.timer > self.nextManaTick and column <= 3 else 0
+
+		# Apply ability and get reward
+		potency = self._potency[action][column]
+		state[-2] = min(state[-2] - self._manaCost[action][column], self.maxMana)
+		state[-1] = self._nextAstralUmbral[action][column]
+		if self.debug:
+			print("%s: %d -> %d, %d" % (ability.name, potency, self.HELPER.GetMana(state), self.HELPER.GetAstralUmbral(state)))
+
+		# Update cooldowns
+		for i in range(len(self.ABILITIES)):
+			if state[i] > 0:
+				# Update spell which is on cooldown
+				state[i] = max(0, state[i] - castTime)
+		# Update cooldown for what was just cast
+		state[action] = self._cooldown[action]
+
+		done = self._isDone()
+
+		return state, self.scaleResult(potency), done, {"Name": ability.name, "Invalid": False, "ManaTicks": ticks}
+
+	def _regenTicks(self, column):
+		""" Catch up on mana ticks passed in Neutral or Umbral Ice, returns how many """
+		change = self._regen[column]
+		ticks = 0
+		while self.timer > self.nextManaTick:
+			self.state[-2] = min(self.state[-2] - change, self.maxMana)
+			self.nextManaTick += self.manaTickTiming
+			ticks += 1
+		return ticks
+
+	class Snapshot:
+		""" Everything needed to resume an episode: the state values, timer and next mana tick """
+		__slots__ = ("state", "timer", "nextManaTick")
+
+		def __init__(self, state, timer, nextManaTick):
+			self.state = state
+			self.timer = timer
+			self.nextManaTick = nextManaTick
+
+		def key(self, quantum=0.01):
+			""" Hashable key with the times quantized, so float drift maps to the same entry """
+			return (self.state, int(round(self.timer / quantum)), int(round(self.nextManaTick / quantum)))
+
+	def snapshot(self):
+		return BLM.Snapshot(tuple(self.state.tolist()), self.timer, self.nextManaTick)
+
+	def restore(self, snapshot):
+		self.state[:] = snapshot.state
+		self.timer = snapshot.timer
+		self.nextManaTick = snapshot.nextManaTick
+		return self.state
+
+	def stateKey(self, quantum=0.01):
+		""" Same as snapshot().key() without building the snapshot """
+		return (tuple(self.state.tolist()), int(round(self.timer / quantum)), int(round(self.nextManaTick / quantum)))
+
+	def cycleKey(self, quantum=0.01):
+		""" stateKey without the time itself, only the mana tick relative to it, so it repeats when the fight loops """
+		return (tuple(self.state.tolist()), int(round((self.nextManaTick - self.timer) / quantum)))
+
+	def _isDone(self):
+		mana = self.HELPER.GetMana(self.state)
+		if mana < 0 or self.timer >= self.MAXTIME:
+			if self.debug:
+				print("DONE: Mana = %d, Timer = %d" % (mana, self.timer))
+			return True
+		return False
+
+	def scaleResult(self, potency):
+		return potency #math.pow(potency / 500, 3)
+
+
+	class Buff:
+		def __init__(self, effect):
+			self.effect = effect
+
+		def apply(self, state):
+			self.effect(state)
+
+	class VectorEnv:
+		"""Steps many BLM environments at once, holding their state as NumPy arrays.
+
+		Reproduces BLM._step exactly (same float operations in the same order) and
+		resets finished environments automatically."""
+
+		def __init__(self, count, maxUmbralAstral, autoReset=True, job="blm"):
+			self.count = count
+			self.autoReset = autoReset
+			self.env = BLM(maxUmbralAstral, job)
+			self.MAXTIME = self.env.MAXTIME
+
+			self.abilityCount = len(self.env.ABILITIES)
+
+			self.rows = np.arange(count)
+			self.states = np.tile(self.env.initialState, (count, 1))
+			self.timer = np.zeros(count)
+			self.nextManaTick = np.zeros(count)
+			self.reset()
+
+		@property
+		def action_space(self):
+			return self.env.action_space
+
+		@property
+		def observation_space(self):
+			return self.env.observation_space
+
+		def reset(self):
+			""" Reset every environment for a fresh run """
+			self.states[:] = self.env.initialState
+			self.timer[:] = 0
+			self.nextManaTick[:] = self.env.manaTickTiming - 0.1
+			return self.states.copy()
+
+		def _resetWhere(self, mask):
+			self.states[mask] = self.env.initialState
+			self.timer[mask] = 0
+			self.nextManaTick[mask] = self.env.manaTickTiming - 0.1
+
+		def step(self, actions):
+			actions = np.asarray(actions)
+			assert actions.shape == (self.count,) and actions.min() >= 0 and actions.max() < self.abilityCount, "Invalid action!"
+
+			mana = self.states[:, -2]
+			astralUmbral = self.states[:, -1]
+			column = astralUmbral + 3
+
+			# Can I cast it?
+			blocked = (self.states[self.rows, actions] > 0) | (mana < self.env.MANACOST[actions, column])
+			neutralFire4 = ~blocked & self.env.NEEDSASTRAL[actions] & (astralUmbral <= BLM.AstralUmbral.Neutral)
+			cast = ~blocked & ~neutralFire4
+
+			self.timer += np.where(cast, self.env.BASECASTTIME[actions], 0.75)
+
+			# Mana regen, skipped by Fire 4 outside of Astral Fire
+			canRegen = ~neutralFire4 & (astralUmbral <= BLM.AstralUmbral.Neutral)
+			ticking = canRegen & (self.timer > self.nextManaTick)
+			while ticking.any():
+				mana[ticking] = np.minimum(mana[ticking] - self.env.REGEN[column[ticking]], self.env.maxMana)
+				self.nextManaTick[ticking] += self.env.manaTickTiming
+				ticking &= self.timer > self.nextManaTick
+
+			# Apply ability and get reward
+			rewards = np.where(blocked, -100.0, 0.0)
+			castRows = self.rows[cast]
+			castActions = actions[cast]
+			castColumn = column[cast]
+			mana[castRows] = np.minimum(mana[castRows] - self.env.MANACOST[castActions, castColumn], self.env.maxMana)
+			rewards[castRows] = self.env.POTENCY[castActions, castColumn]
+			astralUmbral[castRows] = self.env.NEXTASTRALUMBRAL[castActions, castColumn]
+
+			# Update cooldowns
+			cooldowns = self.states[castRows, :self.abilityCount]
+			cooldowns = np.where(cooldowns > 0, np.maximum(0, cooldowns - self.env.BASECASTTIME[castActions][:, None]), cooldowns)
+			cooldowns[np.arange(len(castRows)), castActions] = self.env.COOLDOWN[castActions]
+			self.states[castRows, :self.abilityCount] = cooldowns
+
+			dones = (mana < 0) | (self.timer >= self.MAXTIME)
+			observations = self.states.copy()
+			info = {"Blocked": blocked, "Invalid": blocked | neutralFire4}
+			if self.autoReset and dones.any():
+				info["TerminalState"] = observations[dones]
+				self._resetWhere(dones)
+				observations[dones] = self.env.initialState
+
+			return observations, self.env.scaleResult(rewards), dones, info
+
+class TickBLM(BLM):
+	"""BLM with time kept in integer centiseconds and cooldowns as absolute ready-at ticks.
+
+	Casting only touches its own cooldown, mana ticks are caught up in closed form and mana
+	uses integer costs (fractional costs round up, regen rounds down, as truncation does in
+	BLM), so results are bit-exact everywhere. Unlike BLM, cooldowns also run down while
+	waiting and are not truncated to whole seconds on every cast."""
+
+	TICKS = 100 # per second
+
+	def __init__(self, maxUmbralAstral, job="blm"):
+		job = Job.load(job, maxUmbralAstral)
+		self.MANATICKS = int(round(job.manaTick * TickBLM.TICKS))
+		self.WAITTICKS = int(round(0.75 * TickBLM.TICKS))
+		BLM.__init__(self, maxUmbralAstral, job)
+
+		self._castTicks = [int(round(ability.castTime * TickBLM.TICKS)) for ability in self.ABILITIES]
+		self._cooldownTicks = [int(round(max(0, ability.refreshTime - ability.castTime) * TickBLM.TICKS)) for ability in self.ABILITIES]
+		self._manaCost = np.ceil(self.MANACOST).astype(int).tolist()
+		self._regen = np.floor(-self.REGEN).astype(int).tolist()
+
+	def _reset(self):
+		""" Reset the environment for a fresh run """
+		self.tick = 0
+		self.manaTick = self.MANATICKS - 10
+		self.readyAt = np.zeros(len(self.ABILITIES), dtype=np.int64)
+		self.mana = self.maxMana
+		self.astralUmbral = 0
+		self.state = self.initialState.copy()
+		self._sync()
+		return self.state
+
+	def _sync(self):
+		""" Refresh the observation and the float timer from the integer state """
+		self.timer = self.tick / TickBLM.TICKS
+		self.nextManaTick = self.manaTick / TickBLM.TICKS
+		abilityCount = len(self.ABILITIES)
+		# Remaining cooldown in whole seconds, rounded up so 0 means ready
+		self.state[:abilityCount] = -((self.tick - np.maximum(self.readyAt, self.tick)) // TickBLM.TICKS)
+		self.state[-2] = self.mana
+		self.state[-1] = self.astralUmbral
+
+	def _step(self, action):
+		assert 0 <= action < len(self.ABILITIES), "Invalid action!"
+
+		ability = self.ABILITIES[action]
+		column = self.astralUmbral + 3
+
+		# Can I cast it?
+		if self.tick < self.readyAt[action] or self.mana < self._manaCost[action][column]:
+			# Still on cooldown!
+			self.tick += self.WAITTICKS
+			ticks = self._regenTicks(column) if column <= 3 else 0
+			self._sync()
+			if self.debug:
+				print("On cooldown: %s" % ability.name)
+			return self.state, self.scaleResult(-100), self._isDone(), {"Name": ability.name, "Invalid": True, "ManaTicks": ticks}
+		elif self._needsAstral[action] and column <= 3:
+			self.tick += self.WAITTICKS
+			self._sync()
+			return self.state, self.scaleResult(0), self._isDone(), {"Name": ability.name, "Invalid": True, "ManaTicks": 0}
+
+		# Increase the time and regen
+		self.tick += self._castTicks[action]
+		ticks = self._regenTicks(column) if column <= 3 else 0
+
+		# Apply ability and get reward
+		potency = self._potency[action][column]
+		self.mana = min(self.mana - self._manaCost[action][column], self.maxMana)
+		self.astralUmbral = self._nextAstralUmbral[action][column]
+		self.readyAt[action] = self.tick + self._cooldownTicks[action]
+		self._sync()
+		if self.debug:
+			print("%s: %d -> %d, %d" % (ability.name, potency, self.mana, self.astralUmbral))
+
+		return self.state, self.scaleResult(potency), self._isDone(), {"Name": ability.name, "Invalid": False, "ManaTicks": ticks}
+
+	def _regenTicks(self, column):
+		""" Every mana tick passed since the last catch up, in one step, returns how many """
+		if self.tick <= self.manaTick:
+			return 0
+		ticks = (self.tick - self.manaTick + self.MANATICKS - 1) // self.MANATICKS
+		self.mana = min(self.mana + ticks * self._regen[column], self.maxMana)
+		self.manaTick += ticks * self.MANATICKS
+		return ticks
+
+	def _isDone(self):
+		if self.mana < 0 or self.tick >= self.MAXTIME * TickBLM.TICKS:
+			if self.debug:
+				print("DONE: Mana = %d, Timer = %d" % (self.mana, self.timer))
+			return True
+		return False
+
+	def snapshot(self):
+		return BLM.Snapshot(tuple(self.readyAt.tolist()) + (self.mana, self.astralUmbral), self.tick, self.manaTick)
+
+	def restore(self, snapshot):
+		self.readyAt[:] = snapshot.state[:-2]
+		self.mana, self.astralUmbral = snapshot.state[-2:]
+		self.tick, self.manaTick = snapshot.timer, snapshot.nextManaTick
+		self._sync()
+		return self.state
+
+	def stateKey(self, quantum=None):
+		""" Already exact, times are integer ticks """
+		return (tuple(self.readyAt.tolist()), self.mana, self.astralUmbral, self.tick, self.manaTick)
+
+	def cycleKey(self, quantum=None):
+		""" stateKey relative to the current tick """
+		return (tuple(np.maximum(self.readyAt - self.tick, 0).tolist()), self.mana, self.astralUmbral, self.manaTick - self.tick)
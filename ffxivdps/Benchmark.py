@@ -0,0 +1,179 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import importlib.util
+import json
+import random
+import sys
+import time
+import numpy as np
+from . import BLM
+from .Memory import Memory
+
+SEED = 1234
+
+# Optimal BLM(3) rotation from RotationSolver, used as the scripted policy
+SCRIPT = [5, 3, 5, 5, 5, 5, 5, 5, 5, 5, 5, 2, 3, 5, 5, 5, 5, 5]
+
+def _best(function, repeats=3):
+    """ Best wall time of a few runs, to keep noise out of the comparison """
+    times = []
+    for _ in range(repeats):
+        startTime = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - startTime)
+    return min(times)
+
+def _seed():
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+def benchStep(envClass, policy, steps=50000):
+    _seed()
+    env = envClass(3)
+    actions = [random.randrange(len(env.ABILITIES)) for _ in range(steps)] if policy == "random" else (SCRIPT * (steps // len(SCRIPT) + 1))[:steps]
+
+    def loop():
+        env._reset()
+        for action in actions:
+            state, reward, done, info = env._step(action)
+            if done:
+                env._reset()
+    return steps / _best(loop)
+
+def benchVectorStep(count=4096, steps=100):
+    _seed()
+    vectorEnv = BLM.BLM.VectorEnv(count, 3)
+    actions = np.random.randint(0, len(vectorEnv.env.ABILITIES), size=(steps, count))
+
+    def loop():
+        vectorEnv.reset()
+        for t in range(steps):
+            vectorEnv.step(actions[t])
+    return count * steps / _best(loop)
+
+def benchReset(resets=50000):
+    env = BLM.BLM(3)
+
+    def loop():
+        for _ in range(resets):
+            env._reset()
+    return _best(loop) / resets * 1e6
+
+def benchMemory(capacity, adds=100000, samples=10000, batchSize=8):
+    _seed()
+    memory = Memory(capacity, 8)
+    states = np.random.randint(0, 316, size=(1024, 8))
+
+    def add():
+        for i in range(adds):
+            memory.add((states[i % 1024], i % 6, 1.0, None if i % 40 == 39 else states[(i + 1) % 1024]))
+
+    def sample():
+        for _ in range(samples):
+            memory.sample(batchSize)
+    return _best(add) / adds * 1e6, _best(sample) / samples * 1e6
+
+def benchReplay(batchSizes, replays=200):
+    """ Agent.replay latency per batch size, needs CNTK """
+    from . import DQNBLM
+    _seed()
+    agent = DQNBLM.Agent()
+    env = BLM.BLM(3)
+    s = env._reset().copy()
+    for _ in range(5000):
+        a = random.randrange(len(env.ABILITIES))
+        s_, r, done, info = env._step(a)
+        agent.memory.add((s, a, r, None if done else s_))
+        s = env._reset().copy() if done else s_.copy()
+
+    results = {}
+    original = DQNBLM.BATCH_SIZE
+    try:
+        for batchSize in batchSizes:
+            DQNBLM.BATCH_SIZE = batchSize
+
+            def loop():
+                for _ in range(replays):
+                    agent.replay()
+            results[batchSize] = _best(loop) / replays * 1e6
+    finally:
+        DQNBLM.BATCH_SIZE = original
+    return results
+
+def benchRun(episodes=20):
+    """ End-to-end DQNBLM.run episodes per second, needs CNTK """
+    from . import DQNBLM
+    _seed()
+    agent = DQNBLM.Agent()
+
+    def loop():
+        for _ in range(episodes):
+            DQNBLM.run(agent)
+    return episodes / _best(loop, repeats=1)
+
+def runAll(quick=False):
+    """ Returns {name: {"value", "unit", "higherIsBetter"}} """
+    results = {}
+
+    def record(name, value, unit, higherIsBetter):
+        results[name] = {"value": value, "unit": unit, "higherIsBetter": higherIsBetter}
+        print("%-32s %14.2f %s" % (name, value, unit))
+
+    steps = 10000 if quick else 50000
+    record("BLM._step.random", benchStep(BLM.BLM, "random", steps), "steps/s", True)
+    record("BLM._step.scripted", benchStep(BLM.BLM, "scripted", steps), "steps/s", True)
+    record("TickBLM._step.random", benchStep(BLM.TickBLM, "random", steps), "steps/s", True)
+    record("BLM.VectorEnv.step", benchVectorStep(), "steps/s", True)
+    record("BLM._reset", benchReset(), "us", False)
+
+    for capacity in ([10000] if quick else [10000, 100000, 1000000]):
+        addTime, sampleTime = benchMemory(capacity)
+        record("Memory.add.%d" % capacity, addTime, "us", False)
+        record("Memory.sample.%d" % capacity, sampleTime, "us", False)
+
+    if importlib.util.find_spec("cntk") is None:
+        print("CNTK not installed, skipping Agent.replay and DQNBLM.run")
+    else:
+        for batchSize, latency in sorted(benchReplay([8, 128, 1024]).items()):
+            record("Agent.replay.%d" % batchSize, latency, "us", False)
+        record("DQNBLM.run", benchRun(5 if quick else 20), "episodes/s", True)
+
+    return results
+
+def compare(results, baseline, tolerance):
+    """ Names of benchmarks that got worse than the baseline by more than tolerance """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], result["value"]
+        change = (new - old) / old if result["higherIsBetter"] else (old - new) / old
+        print("%-32s %14.2f -> %14.2f  %+6.1f%%" % (name, old, new, 100 * change))
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmarks for BLM, replay memory and DQN training")
+    parser.add_argument("--output", default="benchmark.json", help="where to write this run's results")
+    parser.add_argument("--baseline", default=None, help="results file to compare against, e.g. ffxivdps/benchmarks/baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown as a fraction")
+    parser.add_argument("--quick", action="store_true")
+    args = parser.parse_args()
+
+    results = runAll(args.quick)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        if args.save_baseline:
+            with open(args.baseline, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        else:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            if regressions:
+                print("REGRESSION: %s" % ", ".join(regressions))
+                sys.exit(1)
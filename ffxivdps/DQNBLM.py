@@ -0,0 +1,383 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import numpy as np
+import math
+import pickle
+import time
+import os
+import random
+import shutil
+from .Memory import Memory, PrioritizedMemory
+from .Metrics import Metrics, nullPhase
+from .Trajectory import TrajectoryWriter
+from .NumpyPolicy import exportWeights
+from . import BLM
+
+C = None # cntk, imported by the first Brain so this module loads without it
+
+isFast = False
+TOTAL_EPISODES = 2000 if isFast else 20000
+OBSERVE = TOTAL_EPISODES / 2
+
+env = BLM.BLM(3)
+
+STATE_COUNT = len(env.initialState)
+ACTION_COUNT = len(env.ABILITIES)
+
+# Targetted reward
+REWARD_TARGET = 5000
+# Averaged over these these many episodes
+BATCH_SIZE_BASELINE = 50
+
+H = STATE_COUNT * 3 / 4 # hidden layer size
+
+MEMORY_CAPACITY = 100000 # KBW: Number of steps saved
+BATCH_SIZE = 32 # samples per replay, replays are UPDATE_EVERY steps apart
+UPDATE_EVERY = 4 # env steps per replay, fewer and larger CNTK calls than replaying every step
+TARGET_UPDATE_EVERY = 250 # replays between copies of the model into the target network
+
+GAMMA = 0.95
+
+PRIORITIZED_REPLAY = False # Sample transitions by TD error instead of uniformly
+
+METRICS_PATH = None # JSONL file for training metrics, stdout if None
+PROFILE = False # Time act, env.step, memory.add, predict and train per step, at some cost to steps/s
+
+CHECKPOINT_EVERY = 500 # episodes, a multiple of BATCH_SIZE_BASELINE keeps the reward window whole on resume
+MAX_EPISODE_STEPS = int(math.ceil(env.MAXTIME / 0.75)) + 1 # every step takes at least 0.75s
+
+MAX_EPSILON = .99 # KBW: Don't change!
+MIN_EPSILON = 0.01 # KBW: keep non-zero to stay a bit curious even when getting old
+#TARGET_EPSILON = 0.01
+#LAMBDA = math.log((TARGET_EPSILON - MIN_EPSILON)/(MAX_EPSILON - MIN_EPSILON)) / -TOTAL_EPISODES  #0.001    # exponent of speed of decay
+
+# The globals above that configure may override
+HYPERPARAMETERS = ("TOTAL_EPISODES", "OBSERVE", "REWARD_TARGET", "BATCH_SIZE_BASELINE", "H", "MEMORY_CAPACITY", "BATCH_SIZE",
+                   "UPDATE_EVERY", "TARGET_UPDATE_EVERY", "GAMMA", "PRIORITIZED_REPLAY", "METRICS_PATH", "PROFILE",
+                   "CHECKPOINT_EVERY", "MAX_EPSILON", "MIN_EPSILON")
+
+def configure(**settings):
+    """ Override hyperparameters by name, OBSERVE follows TOTAL_EPISODES unless it is given too """
+    module = globals()
+    for name, value in settings.items():
+        if name not in HYPERPARAMETERS:
+            raise ValueError("Unknown hyperparameter: %s" % name)
+        module[name] = value
+    if "TOTAL_EPISODES" in settings and "OBSERVE" not in settings:
+        module["OBSERVE"] = module["TOTAL_EPISODES"] / 2
+
+def _importCntk():
+    global C
+    if C is None:
+        import cntk
+        import cntk.distributed
+        C = cntk
+
+class Brain:
+    def __init__(self):
+        _importCntk()
+        self.params = {}
+        self.model, self.trainer, self.loss = self._create()
+        self.updateTarget()
+        # self.model.load_weights("cartpole-basic.h5")
+
+    def _create(self):
+        observation = C.sequence.input_variable(STATE_COUNT, np.float32, name="s")
+        q_target = C.sequence.input_variable(ACTION_COUNT, np.float32, name="q")
+        weight = C.sequence.input_variable(1, np.float32, name="w") # importance-sampling weight
+        self.inputs = (observation, q_target, weight)
+
+        # Following a style similar to Keras
+        l1 = C.layers.Dense(H, activation=C.sigmoid)
+        l2 = C.layers.Dense(ACTION_COUNT)
+        unbound_model = C.layers.Sequential([l1, l2])
+        model = unbound_model(observation)
+
+        self.params = dict(W1=l1.W, b1=l1.b, W2=l2.W, b2=l2.b)
+
+        # loss='mse', scaled per sample for prioritized replay
+        loss = C.reduce_mean(weight * C.square(model - q_target), axis=0)
+        meas = C.reduce_mean(C.square(model - q_target), axis=0)
+
+        # optimizer
+        lr = 1
+        lr_schedule = C.learning_rate_schedule(lr, C.UnitType.minibatch)
+        learner = C.sgd(model.parameters, lr_schedule, gradient_clipping_threshold_per_sample=10)
+
+		# <Parallel>
+   #     distributed_learner = distributed.data_parallel_distributed_learner(
+			#learner = learner,
+			#num_quantization_bits = 32,
+			#distributed_after = 0)
+		# </Parallel>
+
+        trainer = C.Trainer(model, (loss, meas), learner)
+
+        # CNTK: return trainer and loss as well
+        return model, trainer, loss
+
+    def train(self, x, y, w=None, epoch=1, verbose=0):
+        #self.model.fit(x, y, batch_size=64, nb_epoch=epoch, verbose=verbose)
+        if w is None:
+            w = np.ones(len(x), dtype=np.float32)
+        arguments = dict(zip(self.inputs, [x, y, w.reshape(-1, 1)]))
+        updated, results =self.trainer.train_minibatch(arguments, outputs=[self.loss.output])
+
+    def predict(self, s):
+        return self.model.eval([s])
+
+    def predictTarget(self, s):
+        return self.target.eval([s])
+
+    def updateTarget(self):
+        # CNTK: frozen clone, its parameters are constants the trainer never touches
+        self.target = self.model.clone(C.CloneMethod.freeze)
+
+    def save(self, path):
+        self.model.save(path)
+
+    def load(self, path):
+        # CNTK: a saved model only, for playing it rather than training further
+        self.model = C.load_model(path)
+
+    def export(self, path):
+        # Weights only, for NumpyPolicy to run without CNTK
+        exportWeights(dict((name, parameter.value) for name, parameter in self.params.items()), path)
+
+    def checkpoint(self, path):
+        # CNTK: model plus learner state, restore_from_checkpoint needs both
+        self.trainer.save_checkpoint(path)
+        self.target.save(path + ".target")
+
+    def restore(self, path):
+        self.trainer.restore_from_checkpoint(path)
+        self.target = C.load_model(path + ".target")
+
+class Agent:
+    steps = 0
+    replays = 0
+
+    def __init__(self, prioritized=None, metrics=None, memoryPath=None):
+        self.brain = Brain()
+        self.epsilon = MAX_EPSILON
+        self.prioritized = prioritized = PRIORITIZED_REPLAY if prioritized is None else prioritized
+        self.metrics = metrics
+        self.phase = metrics.phase if metrics is not None else nullPhase
+        if prioritized:
+            self.memory = PrioritizedMemory(MEMORY_CAPACITY, STATE_COUNT, np.int16, path=memoryPath)
+        else:
+            self.memory = Memory(MEMORY_CAPACITY, STATE_COUNT, np.int16, path=memoryPath)
+
+    def act(self, s):
+        if random.random() < self.epsilon:
+            return random.randint(0, ACTION_COUNT-1)
+        else:
+            return np.argmax(self.brain.predict(s))
+
+    def observe(self, sample):  # in (s, a, r, s_) format
+        self.memory.add(sample)
+
+        # slowly decrease Epsilon based on our experience
+        self.steps += 1
+        
+        if (self.steps >= OBSERVE):
+            self.epsilon -= (MAX_EPSILON - MIN_EPSILON) / (TOTAL_EPISODES - OBSERVE) # MIN_EPSILON + (MAX_EPSILON - MIN_EPSILON) * math.exp(-LAMBDA * self.steps)
+
+    def replay(self):
+        # CNTK: batches come back as float32, terminal next states zeroed
+        batch = self.memory.sample(BATCH_SIZE)
+        states, actions, rewards, states_, dones = batch[:5]
+        batchLen = len(states)
+        if batchLen == 0:
+            return
+
+        # Next state values come from the target network, CNTK: [0] because of sequence dimension
+        with self.phase("predict"):
+            p = self.brain.predict(states)[0]
+            p_ = self.brain.predictTarget(states_)[0]
+
+        # Bellman targets, terminal transitions only keep their reward
+        y = p.copy()
+        rows = np.arange(batchLen)
+        y[rows, actions] = np.where(dones, rewards, rewards + GAMMA * np.amax(p_, axis=1))
+
+        with self.phase("train"):
+            if self.prioritized:
+                slots, weights = batch[5:]
+                self.memory.update(slots, y[rows, actions] - p[rows, actions])
+                self.brain.train(states, y, weights)
+            else:
+                self.brain.train(states, y)
+
+        self.replays += 1
+        if self.replays % TARGET_UPDATE_EVERY == 0:
+            self.brain.updateTarget()
+
+    def save(self, path):
+        self.brain.save(path)
+
+def run(agent, trajectory=None):
+    # BLM updates its state in place, so keep our own copies
+    s = env.reset().copy()
+    R = 0
+    steps = invalidCasts = manaTicks = manaCatchUps = 0
+    act, step, observe, replay = (agent.phase(name) for name in ("act", "env.step", "memory.add", "replay"))
+
+    while True:
+        # CNTK: explicitly setting to float32
+        with act:
+            a = agent.act(s.astype(np.float32))
+
+        with step:
+            s_, r, done, info = env.step(a)
+        if trajectory is not None:
+            trajectory.record(a, r, s_, env.timer, done)
+
+        if done: # terminal state
+            s_ = None
+        else:
+            s_ = s_.copy()
+
+        with observe:
+            agent.observe((s, a, r, s_))
+        if agent.steps % UPDATE_EVERY == 0:
+            with replay:
+                agent.replay()
+
+        s = s_
+        R += r
+        steps += 1
+        invalidCasts += info["Invalid"]
+        manaTicks += info["ManaTicks"]
+        manaCatchUps += info["ManaTicks"] > 1 # ticks missed in Astral Fire
+
+        if done:
+            if env.debug:
+                print("  REWARD: %d" % R)
+            if agent.metrics is not None:
+                agent.metrics.count("invalidCasts", invalidCasts)
+                agent.metrics.count("manaTicks", manaTicks)
+                agent.metrics.count("manaCatchUps", manaCatchUps)
+                agent.metrics.episode(R, steps, epsilon=agent.epsilon)
+            return R
+
+def saveCheckpoint(agent, path, episode, targetEpisode, every=None):
+    """Write everything needed to continue training after episode into path, the next save comes every episodes later.
+
+    The replay memory is only flushed, its files are mapped in place. state.pkl is replaced last
+    and names the trainer and undo files, so a crash mid-save leaves the previous checkpoint intact."""
+    every = CHECKPOINT_EVERY if every is None else every
+    trainerFile = "trainer-%d.dnn" % episode
+    agent.brain.checkpoint(os.path.join(path, trainerFile))
+    state = {
+        "episode": episode,
+        "targetEpisode": targetEpisode,
+        "trainer": trainerFile,
+        "steps": agent.steps,
+        "replays": agent.replays,
+        "epsilon": agent.epsilon,
+        "memory": agent.memory.flush((every + 1) * MAX_EPISODE_STEPS, episode),
+        "random": random.getstate(),
+        "npRandom": np.random.get_state()}
+    with open(os.path.join(path, "state.pkl.tmp"), "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(os.path.join(path, "state.pkl.tmp"), os.path.join(path, "state.pkl"))
+
+    for name in os.listdir(path):
+        if name.startswith("trainer-") and not name.startswith(trainerFile):
+            os.remove(os.path.join(path, name))
+
+def clearCheckpoint(path):
+    """Remove a previous run's checkpoint from path: state.pkl, trainer files and the replay memory.
+
+    A fresh run would otherwise write its memory into the old mapped files, and a later resume
+    would put the old run's index, size and undo slots back on top of it."""
+    if not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        if name in ("state.pkl", "state.pkl.tmp") or name.startswith("trainer-"):
+            os.remove(os.path.join(path, name))
+    shutil.rmtree(os.path.join(path, "memory"), ignore_errors=True)
+
+def loadCheckpoint(agent, path):
+    """Restore an agent built with memoryPath inside path, returns (episode, targetEpisode).
+
+    Slots overwritten since the checkpoint are put back from its undo file, so the run continues bit-for-bit."""
+    with open(os.path.join(path, "state.pkl"), "rb") as f:
+        state = pickle.load(f)
+    agent.brain.restore(os.path.join(path, state["trainer"]))
+    agent.steps = state["steps"]
+    agent.replays = state["replays"]
+    agent.epsilon = state["epsilon"]
+    agent.memory.restore(state["memory"])
+    random.setstate(state["random"])
+    np.random.set_state(state["npRandom"])
+    return state["episode"], state["targetEpisode"]
+
+def addArguments(parser):
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument("--checkpoint", default=os.path.join(dirname, "checkpoint"), help="checkpoint directory")
+    parser.add_argument("--checkpoint-every", type=int, default=None, help="episodes between checkpoints, 0 to disable")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint directory")
+    parser.add_argument("--model", default=os.path.join(dirname, "model.cmf"), help="where to save the trained model, its weights also go to the same name with .npz")
+    parser.add_argument("--trajectory", default=None, help="record every training step to this trajectory file")
+    parser.add_argument("--profile", action="store_true", default=None, help="time each phase of a step in the metrics, same as --set profile=true")
+
+def train(checkpoint, checkpointEvery=None, resume=False, model=None, trajectoryPath=None, profile=None):
+    """ Train an Agent for TOTAL_EPISODES, checkpointing into the checkpoint directory, and return it """
+    checkpointEvery = CHECKPOINT_EVERY if checkpointEvery is None else checkpointEvery
+    profile = PROFILE if profile is None else profile
+    startTime = time.time()
+    metrics = Metrics(METRICS_PATH, every=BATCH_SIZE_BASELINE, window=BATCH_SIZE_BASELINE, profile=profile)
+    if not resume:
+        clearCheckpoint(checkpoint)
+    agent = Agent(metrics=metrics, memoryPath=os.path.join(checkpoint, "memory"))
+    episode_number = 0
+    targetEpisode = None
+    if resume:
+        episode_number, targetEpisode = loadCheckpoint(agent, checkpoint)
+        metrics.episodes = episode_number
+        print('Resumed at episode %d' % episode_number)
+    trajectory = None
+    if trajectoryPath is not None:
+        trajectory = TrajectoryWriter(trajectoryPath, STATE_COUNT - 2, append=resume, episode=episode_number if resume else None)
+
+    while episode_number < TOTAL_EPISODES:
+        env.debug = False
+        run(agent, trajectory)
+        episode_number += 1
+        if targetEpisode is None and episode_number % BATCH_SIZE_BASELINE == 0 and np.mean(metrics.rewards) >= REWARD_TARGET:
+            targetEpisode = episode_number
+            print('Reached target in %d episodes' % targetEpisode)
+        if checkpointEvery and episode_number % checkpointEvery == 0:
+            saveCheckpoint(agent, checkpoint, episode_number, targetEpisode, checkpointEvery)
+            if trajectory is not None:
+                trajectory.flush()
+    metrics.close()
+    if trajectory is not None:
+        trajectory.close()
+    agent.metrics = None # the greedy run below is not training
+
+    print("%d" % (time.time() - startTime))
+
+    if model is not None:
+        agent.save(model)
+        agent.brain.export(os.path.splitext(model)[0] + ".npz")
+
+    agent.epsilon = 0
+    env.debug = True
+    reward = run(agent)
+    print("Reward: %d" % reward)
+
+    C.distributed.Communicator.finalize()
+    return agent
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DQN training on BLM")
+    addArguments(parser)
+    args = parser.parse_args(argv)
+    train(args.checkpoint, args.checkpoint_every, args.resume, args.model, args.trajectory, args.profile)
+
+if __name__ == "__main__":
+    main()
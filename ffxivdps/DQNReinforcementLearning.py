@@ -1,21 +1,19 @@
 from __future__ import print_function
 from __future__ import division
-import gym
 import numpy as np
 import math
 import os
 import random
-import BlmDamage
+from .Memory import Memory
 
-import cntk as C
+C = None # cntk, imported with gym in main so this module loads without them
 
 isFast = False
 
-env = gym.make('CartPole-v0')
-#env = BlmDamage.BlmDamage()
-
-STATE_COUNT = env.observation_space.shape[0]
-ACTION_COUNT = env.action_space.n
+# Set by main from the environment
+env = None
+STATE_COUNT = None
+ACTION_COUNT = None
 
 # Targetted reward
 REWARD_TARGET = 30 if isFast else 200
@@ -28,6 +26,7 @@ class Brain:
     def __init__(self):
         self.params = {}
         self.model, self.trainer, self.loss = self._create()
+        self.updateTarget()
         # self.model.load_weights("cartpole-basic.h5")
 
     def _create(self):
@@ -63,25 +62,18 @@ class Brain:
     def predict(self, s):
         return self.model.eval([s])
 
-class Memory:   # stored as ( s, a, r, s_ )
-    samples = []
-
-    def __init__(self, capacity):
-        self.capacity = capacity
-
-    def add(self, sample):
-        self.samples.append(sample)
+    def predictTarget(self, s):
+        return self.target.eval([s])
 
-        if len(self.samples) > self.capacity:
-            self.samples.pop(0)
-
-    def sample(self, n):
-        n = min(n, len(self.samples))
-        return random.sample(self.samples, n)
+    def updateTarget(self):
+        # CNTK: frozen clone, its parameters are constants the trainer never touches
+        self.target = self.model.clone(C.CloneMethod.freeze)
 
 
 MEMORY_CAPACITY = 1000000
 BATCH_SIZE = 128
+UPDATE_EVERY = 4 # env steps per replay
+TARGET_UPDATE_EVERY = 250 # replays between copies of the model into the target network
 
 GAMMA = 0.99 # discount factor
 
@@ -91,11 +83,12 @@ LAMBDA = 0.0001    # speed of decay
 
 class Agent:
     steps = 0
+    replays = 0
     epsilon = MAX_EPSILON
 
     def __init__(self):
         self.brain = Brain()
-        self.memory = Memory(MEMORY_CAPACITY)
+        self.memory = Memory(MEMORY_CAPACITY, STATE_COUNT, np.float32)
 
     def act(self, s):
         if random.random() < self.epsilon:
@@ -111,37 +104,25 @@ class Agent:
         self.epsilon = MIN_EPSILON + (MAX_EPSILON - MIN_EPSILON) * math.exp(-LAMBDA * self.steps)
 
     def replay(self):
-        batch = self.memory.sample(BATCH_SIZE)
-        batchLen = len(batch)
-
-        no_state = np.zeros(STATE_COUNT)
-
-
-        # CNTK: explicitly setting to float32
-        states = np.array([ o[0] for o in batch ], dtype=np.float32)
-        states_ = np.array([(no_state if o[3] is None else o[3]) for o in batch ], dtype=np.float32)
-
-        p = agent.brain.predict(states)
-        p_ = agent.brain.predict(states_)
-
-        # CNTK: explicitly setting to float32
-        x = np.zeros((batchLen, STATE_COUNT)).astype(np.float32)
-        y = np.zeros((batchLen, ACTION_COUNT)).astype(np.float32)
+        # CNTK: batches come back as float32, terminal next states zeroed
+        states, actions, rewards, states_, dones = self.memory.sample(BATCH_SIZE)
+        batchLen = len(states)
+        if batchLen == 0:
+            return
 
-        for i in range(batchLen):
-            s, a, r, s_ = batch[i]
+        # Next state values come from the target network, CNTK: [0] because of sequence dimension
+        p = self.brain.predict(states)[0]
+        p_ = self.brain.predictTarget(states_)[0]
 
-            # CNTK: [0] because of sequence dimension
-            t = p[0][i]
-            if s_ is None:
-                t[a] = r
-            else:
-                t[a] = r + GAMMA * np.amax(p_[0][i])
+        # Bellman targets, terminal transitions only keep their reward
+        y = p.copy()
+        y[np.arange(batchLen), actions] = np.where(dones, rewards, rewards + GAMMA * np.amax(p_, axis=1))
 
-            x[i] = s
-            y[i] = t
+        self.brain.train(states, y)
 
-        self.brain.train(x, y)
+        self.replays += 1
+        if self.replays % TARGET_UPDATE_EVERY == 0:
+            self.brain.updateTarget()
 
 
 TOTAL_EPISODES = 2000 if isFast else 3000
@@ -160,7 +141,8 @@ def run(agent):
             s_ = None
 
         agent.observe((s, a, r, s_))
-        agent.replay()
+        if agent.steps % UPDATE_EVERY == 0:
+            agent.replay()
 
         s = s_
         R += r
@@ -168,15 +150,29 @@ def run(agent):
         if done:
             return R
 
-agent = Agent()
-
-episode_number = 0
-reward_sum = 0
-while episode_number < TOTAL_EPISODES:
-    reward_sum += run(agent)
-    episode_number += 1
-    if episode_number % BATCH_SIZE_BASELINE == 0:
-        print('Episode: %d, Average reward for episode %f.' % (episode_number,
-                                                               reward_sum / BATCH_SIZE_BASELINE))
-        print('Task solved in %d episodes' % episode_number)
-        reward_sum = 0
\ No newline at end of file
+def main():
+    global C, env, STATE_COUNT, ACTION_COUNT
+    import cntk
+    import gym
+    C = cntk
+
+    env = gym.make('CartPole-v0')
+    #env = BlmDamage.BlmDamage()
+    STATE_COUNT = env.observation_space.shape[0]
+    ACTION_COUNT = env.action_space.n
+
+    agent = Agent()
+
+    episode_number = 0
+    reward_sum = 0
+    while episode_number < TOTAL_EPISODES:
+        reward_sum += run(agent)
+        episode_number += 1
+        if episode_number % BATCH_SIZE_BASELINE == 0:
+            print('Episode: %d, Average reward for episode %f.' % (episode_number,
+                                                                   reward_sum / BATCH_SIZE_BASELINE))
+            print('Task solved in %d episodes' % episode_number)
+            reward_sum = 0
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import numpy as np
+from . import BLM
+from .NumpyPolicy import NumpyPolicy
+
+def evaluatePolicy(brain, episodes=256, envCount=256, epsilon=0.0, seed=0, maxTime=None, maxUmbralAstral=3):
+    """Potency of every episode of an epsilon-greedy policy over brain's Q values.
+
+    Runs envCount BLMs in lockstep on a VectorEnv. Each step stacks their states into one
+    matrix for a single brain.predict, takes the argmax for all of them at once and draws
+    the exploration for all of them with a single RNG call. Every env plays the same number
+    of episodes and the first episodes of them are returned, round by round over the envs."""
+    envCount = min(envCount, episodes)
+    perEnv = -(-episodes // envCount)
+    vectorEnv = BLM.BLM.VectorEnv(envCount, maxUmbralAstral)
+    if maxTime is not None:
+        vectorEnv.MAXTIME = maxTime
+    actionCount = vectorEnv.abilityCount
+    random = np.random.RandomState(seed)
+
+    states = vectorEnv.reset()
+    totals = np.zeros(envCount)
+    played = np.zeros(envCount, dtype=np.int64)
+    potencies = np.zeros((envCount, perEnv))
+    rows = np.arange(envCount)
+    while played.min() < perEnv:
+        # CNTK: one sequence of envCount states, [0] drops the sequence dimension
+        actions = np.argmax(brain.predict(states.astype(np.float32))[0], axis=1)
+        if epsilon > 0:
+            draws = random.random_sample((envCount, 2))
+            actions = np.where(draws[:, 0] < epsilon, (draws[:, 1] * actionCount).astype(np.int64), actions)
+
+        states, rewards, dones, info = vectorEnv.step(actions)
+        active = played < perEnv
+        totals += np.where(active, rewards, 0)
+        finished = rows[dones & active]
+        potencies[finished, played[finished]] = totals[finished]
+        played[finished] += 1
+        totals[dones] = 0
+    return potencies.T.ravel()[:episodes]
+
+def evaluateGrid(brain, seeds=(0, 1, 2), maxTimes=(None,), **settings):
+    """ evaluatePolicy for every seed and fight length, keyed by (seed, maxTime) """
+    return dict(((seed, maxTime), evaluatePolicy(brain, seed=seed, maxTime=maxTime, **settings)) for maxTime in maxTimes for seed in seeds)
+
+def playLongFight(env, policy, fightLength=600):
+    """One fight of fightLength seconds under a deterministic policy, a function of the state only.
+
+    Every decision's env.cycleKey is remembered. Once one repeats, the fight is a prefix and
+    then that cycle over and over, so the total is prefix + k cycles + the part of one more
+    cycle that fits, without simulating them. Returns the potency, its DPS, steps played and
+    simulated, and the cycle (None if the fight ended first) with its steady state DPS.
+    env.MAXTIME is restored afterwards."""
+    maxTime = env.MAXTIME
+    env.MAXTIME = fightLength
+    try:
+        state = env._reset()
+        seen = {}
+        potencies = [0.0] # before each decision
+        timers = [env.timer]
+        while True:
+            key = env.cycleKey()
+            if key in seen:
+                break
+            seen[key] = len(potencies) - 1
+            state, reward, done, info = env._step(policy(state))
+            potencies.append(potencies[-1] + reward)
+            timers.append(env.timer)
+            if done:
+                steps = len(potencies) - 1
+                return {"potency": potencies[-1], "dps": potencies[-1] / env.timer, "steps": steps, "simulated": steps, "cycle": None}
+
+        start, now = seen[key], len(potencies) - 1
+        length = now - start
+        cyclePotency = potencies[now] - potencies[start]
+        cycleTime = timers[now] - timers[start]
+
+        # The fight ends on the first step whose timer reaches fightLength, step j of the cycle
+        # does after k more cycles when its timer plus k cycle times does
+        after = np.array(timers[start + 1:now + 1])
+        cycles = np.maximum(0, np.ceil((fightLength - after) / cycleTime - 1e-9)).astype(np.int64)
+        j = int(np.argmin(cycles * length + np.arange(length)))
+        potency = potencies[start + 1 + j] + cycles[j] * cyclePotency
+        timer = after[j] + cycles[j] * cycleTime
+        return {
+            "potency": float(potency),
+            "dps": float(potency / timer),
+            "steps": int(start + cycles[j] * length + j + 1),
+            "simulated": now,
+            "cycle": {"start": start, "steps": length, "seconds": float(cycleTime), "repeats": int(cycles[j]),
+                      "potency": float(cyclePotency), "dps": float(cyclePotency / cycleTime)}}
+    finally:
+        env.MAXTIME = maxTime
+
+def greedyPolicy(brain):
+    """ The brain's argmax action for a state """
+    return lambda state: int(np.argmax(brain.predict(state.astype(np.float32))))
+
+def evaluateLongFight(brain, fightLengths=(300, 600), maxUmbralAstral=3, tick=False):
+    """ playLongFight of brain's greedy policy for every fight length, on TickBLM when tick """
+    env = (BLM.TickBLM if tick else BLM.BLM)(maxUmbralAstral)
+    return dict((fightLength, playLongFight(env, greedyPolicy(brain), fightLength)) for fightLength in fightLengths)
+
+def summarize(potencies):
+    return {
+        "episodes": len(potencies),
+        "mean": float(np.mean(potencies)),
+        "std": float(np.std(potencies)),
+        "min": float(np.min(potencies)),
+        "p10": float(np.percentile(potencies, 10)),
+        "median": float(np.median(potencies)),
+        "p90": float(np.percentile(potencies, 90)),
+        "max": float(np.max(potencies))}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate a saved DQNBLM model on many BLM fights at once")
+    parser.add_argument("model", help="saved DQNBLM model, or its .npz weights to evaluate without CNTK")
+    parser.add_argument("--episodes", type=int, default=1024)
+    parser.add_argument("--envs", type=int, default=256)
+    parser.add_argument("--epsilon", type=float, default=0.0)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--max-times", type=float, nargs="+", default=[None])
+    parser.add_argument("--long", type=float, nargs="+", default=None, help="fight lengths in seconds to play greedily with cycle detection instead")
+    parser.add_argument("--tick", action="store_true", help="play --long fights on the integer tick engine")
+    args = parser.parse_args()
+
+    if args.model.endswith(".npz"):
+        brain = NumpyPolicy.load(args.model)
+    else:
+        from . import DQNBLM
+        brain = DQNBLM.Brain()
+        brain.load(args.model)
+    if args.long is not None:
+        for fightLength, result in sorted(evaluateLongFight(brain, args.long, tick=args.tick).items()):
+            cycle = result["cycle"]
+            steadyState = "no cycle" if cycle is None else "cycle of %d steps (%.2fs) from step %d, steady state %.1f DPS" % (
+                cycle["steps"], cycle["seconds"], cycle["start"], cycle["dps"])
+            print("%ss: %d potency, %.1f DPS, %d steps (%d simulated), %s" % (
+                fightLength, result["potency"], result["dps"], result["steps"], result["simulated"], steadyState))
+        raise SystemExit
+    results = evaluateGrid(brain, args.seeds, args.max_times, episodes=args.episodes, envCount=args.envs, epsilon=args.epsilon)
+    for (seed, maxTime), potencies in sorted(results.items(), key=lambda item: (item[0][1] or 0, item[0][0])):
+        print("seed %d, %ss: %s" % (seed, maxTime or BLM.BLM(3).MAXTIME, summarize(potencies)))
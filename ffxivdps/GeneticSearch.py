@@ -0,0 +1,179 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import os
+import pickle
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from . import BLM
+from .RotationTrie import RotationTrie
+
+# Per worker process environment, built once by _initWorker
+_vectorEnvs = {}
+_maxUmbralAstral = 3
+_trie = None
+
+def _initWorker(maxUmbralAstral, trieCapacity=0):
+    global _maxUmbralAstral, _trie
+    _maxUmbralAstral = maxUmbralAstral
+    _trie = RotationTrie(maxUmbralAstral, trieCapacity) if trieCapacity else None
+
+def evaluateRotations(rotations, maxUmbralAstral=None):
+    """ Total reward of each fixed-length rotation (rows of ability indices) played from a fresh BLM """
+    if maxUmbralAstral is None:
+        maxUmbralAstral = _maxUmbralAstral
+    if _trie is not None and maxUmbralAstral == _maxUmbralAstral:
+        return _trie.evaluateMany(rotations)
+    count, length = rotations.shape
+    vectorEnv = _vectorEnvs.get((count, maxUmbralAstral))
+    if vectorEnv is None:
+        vectorEnv = _vectorEnvs[(count, maxUmbralAstral)] = BLM.BLM.VectorEnv(count, maxUmbralAstral, autoReset=False)
+
+    vectorEnv.reset()
+    totals = np.zeros(count)
+    running = np.ones(count, dtype=bool)
+    for t in range(length):
+        states, rewards, dones, info = vectorEnv.step(rotations[:, t])
+        totals += np.where(running, rewards, 0)
+        running &= ~dones
+        if not running.any():
+            break
+    return totals
+
+class GeneticSearch:
+    """Evolves fixed-length rotations scored against BLM, with fitness evaluated across a process pool.
+
+    Uses elitism, tournament selection, two-point crossover and per-gene mutation."""
+
+    def __init__(self, maxUmbralAstral=3, length=100, populationSize=1024, eliteCount=8, tournamentSize=3,
+                 mutationRate=0.02, workers=None, checkpointPath=None, checkpointEvery=10, seed=0, trieCapacity=0):
+        self.maxUmbralAstral = maxUmbralAstral
+        self.abilityCount = len(BLM.BLM(maxUmbralAstral).ABILITIES)
+        self.length = length
+        self.populationSize = populationSize
+        self.eliteCount = eliteCount
+        self.tournamentSize = tournamentSize
+        self.mutationRate = mutationRate
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpointPath = checkpointPath
+        self.checkpointEvery = checkpointEvery
+        self.trieCapacity = trieCapacity
+
+        self.random = np.random.RandomState(seed)
+        self.generation = 0
+        self.population = self.random.randint(0, self.abilityCount, size=(populationSize, length))
+        self.fitness = None
+        self.history = []
+
+        if checkpointPath is not None and os.path.exists(checkpointPath):
+            self.load(checkpointPath)
+
+    def evaluate(self, executor):
+        """ Score the population in one batch per worker """
+        batches = np.array_split(self.population, self.workers)
+        self.fitness = np.concatenate(list(executor.map(evaluateRotations, [b for b in batches if len(b)])))
+
+    def _tournament(self, count):
+        entrants = self.random.randint(0, self.populationSize, size=(count, self.tournamentSize))
+        winners = np.argmax(self.fitness[entrants], axis=1)
+        return self.population[entrants[np.arange(count), winners]]
+
+    def _breed(self):
+        order = np.argsort(-self.fitness)
+        elites = self.population[order[:self.eliteCount]]
+        childCount = self.populationSize - self.eliteCount
+
+        # Two-point crossover between tournament winners
+        mothers = self._tournament(childCount)
+        fathers = self._tournament(childCount)
+        cuts = np.sort(self.random.randint(0, self.length + 1, size=(childCount, 2)), axis=1)
+        genes = np.arange(self.length)
+        fromFather = (genes >= cuts[:, :1]) & (genes < cuts[:, 1:])
+        children = np.where(fromFather, fathers, mothers)
+
+        # Mutation replaces single genes with a random ability
+        mutate = self.random.random_sample(children.shape) < self.mutationRate
+        children[mutate] = self.random.randint(0, self.abilityCount, size=mutate.sum())
+
+        self.population = np.concatenate((elites, children))
+
+    def run(self, generations, report=None):
+        """ Evolve for the given number of generations, returns the best rotation and its potency """
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_initWorker, initargs=(self.maxUmbralAstral, self.trieCapacity)) as executor:
+            if self.fitness is None:
+                self.evaluate(executor)
+            while self.generation < generations:
+                startTime = time.time()
+                self._breed()
+                self.evaluate(executor)
+                self.generation += 1
+                self.history.append((self.generation, float(self.fitness.max()), float(self.fitness.mean())))
+
+                if report is not None:
+                    report(self, time.time() - startTime)
+                if self.checkpointPath is not None and self.generation % self.checkpointEvery == 0:
+                    self.save(self.checkpointPath)
+
+        if self.checkpointPath is not None:
+            self.save(self.checkpointPath)
+        return self.best()
+
+    def best(self):
+        i = np.argmax(self.fitness)
+        return self.population[i], self.fitness[i]
+
+    def save(self, path):
+        """ Write the population, fitness and RNG state so the search can resume """
+        checkpoint = {
+            "generation": self.generation,
+            "population": self.population,
+            "fitness": self.fitness,
+            "history": self.history,
+            "random": self.random.get_state()}
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def load(self, path):
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+        self.generation = checkpoint["generation"]
+        self.population = checkpoint["population"]
+        self.fitness = checkpoint["fitness"]
+        self.history = checkpoint["history"]
+        self.random.set_state(checkpoint["random"])
+        self.populationSize, self.length = self.population.shape
+
+def printRotation(rotation, maxUmbralAstral):
+    """ Replay a rotation on BLM with debug output """
+    env = BLM.BLM(maxUmbralAstral)
+    env.debug = True
+    env._reset()
+    total = 0
+    for action in rotation:
+        state, reward, done, info = env._step(int(action))
+        total += reward
+        if done:
+            break
+    print("Potency: %d" % total)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genetic search for BLM rotations")
+    parser.add_argument("--generations", type=int, default=200)
+    parser.add_argument("--population", type=int, default=1024)
+    parser.add_argument("--length", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trie-capacity", type=int, default=0, help="score through a RotationTrie of this many nodes per worker")
+    args = parser.parse_args()
+
+    def report(search, seconds):
+        generation, best, mean = search.history[-1]
+        print("Gen: %d, best: %d, avg: %f, %.2fs" % (generation, best, mean, seconds))
+
+    search = GeneticSearch(length=args.length, populationSize=args.population, workers=args.workers,
+                           checkpointPath=args.checkpoint, seed=args.seed, trieCapacity=args.trie_capacity)
+    rotation, potency = search.run(args.generations, report)
+    printRotation(rotation, search.maxUmbralAstral)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+# Bump when compileSpec changes, so tables cached by an older version are not reused
+COMPILER_VERSION = 1
+
+JOBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs")
+CACHE = os.environ.get("FFXIVDPS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ffxivdps"))
+
+# Tables indexed by [ability, Astral/Umbral + 3] (or [Astral/Umbral + 3] for REGEN)
+TABLES = ("POTENCY", "MANACOST", "CASTTIME", "NEXTASTRALUMBRAL", "BASECASTTIME", "COOLDOWN", "NEEDSASTRAL", "REGEN")
+
+class Ability:
+    def __init__(self, name, potency, mana, castTime, refreshTime, element, transition, requires=None):
+        self.name = name
+        self.potency = potency
+        self.mana = mana
+        self.castTime = castTime
+        self.refreshTime = refreshTime
+        self.element = element
+        self.transition = transition
+        self.requires = requires
+
+class Job:
+    """A job definition loaded from a JSON spec in jobs/, with its mechanics compiled to lookup tables.
+
+    The spec lists abilities (potency, mana, cast and recast time, element, Astral/Umbral
+    transition), per element scaling of potency, mana and cast time, named transitions and mana
+    regen. Tables from compileSpec are cached on disk by spec hash and maxUmbralAstral."""
+
+    def __init__(self, spec, maxUmbralAstral, tables):
+        self.spec = spec
+        self.maxUmbralAstral = maxUmbralAstral
+        self.name = spec["name"]
+        self.maxMana = spec["maxMana"]
+        self.manaTick = spec["manaTick"]
+        self.maxTime = spec["maxTime"]
+        self.abilities = [Ability(a["name"], a["potency"], a["mana"], a["castTime"], a["recast"], a["element"], a["transition"], a.get("requires"))
+                          for a in spec["abilities"]]
+        for name in TABLES:
+            setattr(self, name, tables[name])
+
+def _transition(rule, astralUmbral, maxUmbralAstral):
+    """ Next Astral/Umbral for one entry of a transition: a number, +n/-n relative and clamped, +-max or same """
+    if rule == "same":
+        return astralUmbral
+    if rule == "max":
+        return maxUmbralAstral
+    if rule == "-max":
+        return -maxUmbralAstral
+    if isinstance(rule, str):
+        return max(-maxUmbralAstral, min(maxUmbralAstral, astralUmbral + int(rule)))
+    return rule
+
+def compileSpec(spec, maxUmbralAstral):
+    """ Evaluate a spec for every Astral/Umbral into the tables BLM steps with """
+    abilities = spec["abilities"]
+    elements = spec["elements"]
+    transitions = spec["transitions"]
+    count = len(abilities)
+    tables = {
+        "POTENCY": np.zeros((count, 7)),
+        "MANACOST": np.zeros((count, 7)),
+        "CASTTIME": np.zeros((count, 7)),
+        "NEXTASTRALUMBRAL": np.zeros((count, 7), dtype=int)}
+    for i, ability in enumerate(abilities):
+        element = elements[ability["element"]]
+        transition = transitions[ability["transition"]]
+        for column in range(7):
+            tables["POTENCY"][i, column] = ability["potency"] * element["potency"][column]
+            tables["MANACOST"][i, column] = ability["mana"] * element["mana"][column]
+            tables["CASTTIME"][i, column] = ability["castTime"] * element["castTime"][column]
+            tables["NEXTASTRALUMBRAL"][i, column] = _transition(transition[column], column - 3, maxUmbralAstral)
+
+    # Timer and cooldowns advance by the unscaled cast time
+    tables["BASECASTTIME"] = np.array([ability["castTime"] for ability in abilities])
+    tables["COOLDOWN"] = np.array([max(0, ability["recast"] - ability["castTime"]) for ability in abilities]).astype(int)
+    tables["NEEDSASTRAL"] = np.array([ability.get("requires") == "astral" for ability in abilities])
+
+    # Mana change per regen tick, negative is a gain
+    tables["REGEN"] = np.array([spec["maxMana"] * -fraction for fraction in spec["regen"]])
+    return tables
+
+def specPath(name):
+    """ A path to a spec, or the name of one in jobs/ """
+    return name if os.path.exists(name) else os.path.join(JOBS, name.lower() + ".json")
+
+def load(name="blm", maxUmbralAstral=3, cache=CACHE):
+    """ Load a job spec and its compiled tables, compiling only when the cache has no entry for it """
+    if isinstance(name, Job):
+        return name
+    with open(specPath(name), "rb") as f:
+        raw = f.read()
+    spec = json.loads(raw.decode("utf-8"))
+
+    key = hashlib.sha256(raw + ("|%d|%d" % (maxUmbralAstral, COMPILER_VERSION)).encode("ascii")).hexdigest()
+    path = os.path.join(cache, "%s-%s.npz" % (spec["name"].lower(), key[:32])) if cache is not None else None
+    if path is not None and os.path.exists(path):
+        # An unreadable entry is a miss, compiling again replaces it
+        try:
+            with np.load(path) as cached:
+                return Job(spec, maxUmbralAstral, dict((name, cached[name]) for name in TABLES))
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            pass
+
+    tables = compileSpec(spec, maxUmbralAstral)
+    if path is not None:
+        # A cache we cannot write is only a slower start
+        try:
+            if not os.path.isdir(cache):
+                os.makedirs(cache, exist_ok=True)
+            # Written under a name of its own, so workers compiling at once never share a partial file
+            fd, temp = tempfile.mkstemp(suffix=".npz", dir=cache)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(f, **tables)
+                os.replace(temp, path)
+            except BaseException:
+                os.remove(temp)
+                raise
+        except OSError:
+            pass
+    return Job(spec, maxUmbralAstral, tables)
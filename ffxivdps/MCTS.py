@@ -0,0 +1,216 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import math
+import random
+import time
+import numpy as np
+from . import BLM
+from .Metrics import nullPhase
+from .NumpyPolicy import NumpyPolicy
+
+class Node:
+    """ A state in the search tree, its children are indexed by action and built on first visit """
+    __slots__ = ("snapshot", "key", "done", "children", "rewards", "visits", "values")
+
+    def __init__(self, snapshot, key, done, actionCount):
+        self.snapshot = snapshot
+        self.key = key
+        self.done = done
+        self.children = [None] * actionCount
+        self.rewards = [0.0] * actionCount
+        self.visits = [0] * actionCount
+        self.values = [0.0] * actionCount # sum of returns through each action
+
+class MCTSAgent:
+    """Picks each action by UCT search from the env's current state, a drop-in for Agent in DQNBLM.run.
+
+    Searches on its own copy of the env, moved between states by snapshot and restore, for
+    iterations per decision or until seconds have passed. Leaves are valued by a random
+    rollout of castable abilities, cut at rolloutDepth steps where brain (a DQNBLM.Brain)
+    values the rest as its max Q. With a brain and rolloutDepth 0 leaves are valued by the
+    network alone. The subtree under the chosen action is kept for the next decision."""
+
+    def __init__(self, env, brain=None, iterations=200, seconds=None, exploration=1.0, rolloutDepth=None, gamma=1.0, seed=None):
+        if iterations is None and seconds is None:
+            raise ValueError("MCTSAgent needs iterations or seconds to bound each search")
+        self.env = env
+        self.sim = type(env)(env.maxUmbralAstral, env.job)
+        self.sim.MAXTIME = env.MAXTIME
+        self.brain = brain
+        self.iterations = iterations
+        self.seconds = seconds
+        self.exploration = exploration
+        self.rolloutDepth = rolloutDepth
+        self.gamma = gamma
+        self.random = random.Random(seed)
+        self.actionCount = len(env.ABILITIES)
+        self.root = None
+
+        # DQNBLM.run interface
+        self.steps = 0
+        self.replays = 0
+        self.epsilon = 0
+        self.metrics = None
+
+        # Statistics
+        self.decisions = 0
+        self.searches = 0
+        self.reused = 0
+        self.searchSeconds = 0.0
+
+        # Returns seen, to scale Q into [0, 1] for the exploration term
+        self.low = float("inf")
+        self.high = -float("inf")
+
+    def phase(self, name):
+        return nullPhase(name)
+
+    def act(self, s):
+        startTime = time.time()
+        key = self.env.stateKey()
+        if self.root is not None and self.root.key == key:
+            self.reused += 1
+        else:
+            self.root = Node(self.env.snapshot(), key, False, self.actionCount)
+
+        iterations = 0
+        while (self.iterations is None or iterations < self.iterations) and (self.seconds is None or time.time() - startTime < self.seconds):
+            self._search(self.root)
+            iterations += 1
+
+        # Most visited action, keeping its subtree for the next decision
+        visits = self.root.visits
+        action = max(range(self.actionCount), key=lambda a: (visits[a], self.root.values[a]))
+        self.root = self.root.children[action]
+
+        self.decisions += 1
+        self.searches += iterations
+        self.searchSeconds += time.time() - startTime
+        return action
+
+    def observe(self, sample):
+        self.steps += 1
+
+    def replay(self):
+        pass
+
+    def decisionsPerSecond(self):
+        return self.decisions / self.searchSeconds if self.searchSeconds else 0.0
+
+    def _select(self, node):
+        """ UCT: untried actions first, then the best scaled mean plus exploration bonus """
+        if 0 in node.visits:
+            return node.visits.index(0)
+        logTotal = math.log(sum(node.visits))
+        scale = self.high - self.low if self.high > self.low else 1.0
+        best, bestScore = 0, -float("inf")
+        for action in range(self.actionCount):
+            visits = node.visits[action]
+            score = (node.values[action] / visits - self.low) / scale + self.exploration * math.sqrt(logTotal / visits)
+            if score > bestScore:
+                best, bestScore = action, score
+        return best
+
+    def _expand(self, node, action):
+        sim = self.sim
+        sim.restore(node.snapshot)
+        state, reward, done, info = sim._step(action)
+        node.rewards[action] = reward
+        child = node.children[action] = Node(sim.snapshot(), sim.stateKey(), done, self.actionCount)
+        return child
+
+    def _rollout(self):
+        """ Return from the sim's current state: random castable abilities, then the brain's estimate """
+        sim = self.sim
+        total, discount, depth = 0.0, 1.0, 0
+        while self.rolloutDepth is None or depth < self.rolloutDepth:
+            state = sim.state
+            column = state[-1] + 3
+            castable = [a for a in range(self.actionCount) if state[a] <= 0 and state[-2] >= sim.MANACOST[a, column]
+                        and not (sim.NEEDSASTRAL[a] and column <= 3)]
+            state, reward, done, info = sim._step(self.random.choice(castable) if castable else self.random.randrange(self.actionCount))
+            total += discount * reward
+            discount *= self.gamma
+            depth += 1
+            if done:
+                return total
+        if self.brain is not None:
+            total += discount * float(np.max(self.brain.predict(sim.state.astype(np.float32))))
+        return total
+
+    def _search(self, root):
+        path = []
+        node = root
+        while not node.done:
+            action = self._select(node)
+            path.append((node, action))
+            child = node.children[action]
+            if child is None:
+                node = self._expand(node, action)
+                break
+            node = child
+
+        if node.done:
+            value = 0.0
+        else:
+            self.sim.restore(node.snapshot)
+            value = self._rollout()
+
+        for parent, action in reversed(path):
+            value = parent.rewards[action] + self.gamma * value
+            parent.visits[action] += 1
+            parent.values[action] += value
+            mean = parent.values[action] / parent.visits[action]
+            self.low = min(self.low, mean)
+            self.high = max(self.high, mean)
+
+def playGreedy(env, brain):
+    """ Potency of one fight taking the brain's argmax action, as Agent does with epsilon 0 """
+    state = env._reset()
+    total = 0
+    while True:
+        state, reward, done, info = env._step(int(np.argmax(brain.predict(state.astype(np.float32)))))
+        total += reward
+        if done:
+            return total
+
+def playMCTS(env, **settings):
+    """ Potency of one fight planned by an MCTSAgent, and the agent for its statistics """
+    agent = MCTSAgent(env, **settings)
+    state = env._reset()
+    total = 0
+    while True:
+        state, reward, done, info = env._step(agent.act(state))
+        total += reward
+        if done:
+            return total, agent
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare MCTS planning on BLM at fixed budgets against the DQN's greedy policy")
+    parser.add_argument("maxUmbralAstral", type=int, nargs="?", default=3)
+    parser.add_argument("--iterations", type=int, nargs="*", default=[50, 200, 1000], help="iteration budgets per decision")
+    parser.add_argument("--seconds", type=float, default=None, help="time budget per decision instead of iterations")
+    parser.add_argument("--model", default=None, help="saved DQNBLM model or its .npz weights, for the greedy baseline and leaf values")
+    parser.add_argument("--rollout-depth", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    env = BLM.BLM(args.maxUmbralAstral)
+    brain = None
+    if args.model is not None:
+        if args.model.endswith(".npz"):
+            brain = NumpyPolicy.load(args.model)
+        else:
+            from . import DQNBLM
+            brain = DQNBLM.Brain()
+            brain.load(args.model)
+        baseline = playGreedy(env, brain)
+        print("DQN greedy: %d" % baseline)
+
+    budgets = [(None, args.seconds)] if args.seconds is not None else [(iterations, None) for iterations in args.iterations]
+    for iterations, seconds in budgets:
+        potency, agent = playMCTS(env, brain=brain, iterations=iterations, seconds=seconds, rolloutDepth=args.rollout_depth, seed=args.seed)
+        budget = "%d iterations" % iterations if iterations is not None else "%.3fs" % seconds
+        gain = " (%+d vs DQN)" % (potency - baseline) if brain is not None else ""
+        print("MCTS %s: %d%s, %.1f decisions/s, %d reused roots" % (budget, potency, gain, agent.decisionsPerSecond(), agent.reused))
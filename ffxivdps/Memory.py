@@ -0,0 +1,218 @@
+import os
+import random
+import numpy as np
+
+def _array(path, name, shape, dtype):
+    """ Zeroed array, or a .npy file under path mapped in place so it is never pickled or copied """
+    if path is None:
+        return np.zeros(shape, dtype=dtype)
+    filename = os.path.join(path, name + ".npy")
+    if os.path.exists(filename):
+        array = np.load(filename, mmap_mode="r+")
+        if array.shape == shape and array.dtype == dtype:
+            return array
+        del array
+    return np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+
+class Memory:   # ring buffer of ( s, a, r, done ), s_ is the state stored in the next slot
+    def __init__(self, capacity, stateCount, stateDtype=np.int16, path=None):
+        """ With a path the buffers live in memory-mapped .npy files there, see flush and restore """
+        self.lastUndo = None
+        self.capacity = capacity
+        self.path = path
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+        self.states = _array(path, "states", (capacity, stateCount), np.dtype(stateDtype))
+        self.actions = _array(path, "actions", (capacity,), np.dtype(np.int32))
+        self.rewards = _array(path, "rewards", (capacity,), np.dtype(np.float32))
+        self.dones = _array(path, "dones", (capacity,), np.dtype(np.bool_))
+
+        self.index = 0 # next slot to write
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _undo(self, reserve):
+        """ Copies of the slots the next reserve adds will overwrite """
+        slots = (self.index + np.arange(min(reserve, self.size))) % self.capacity
+        return {"slots": slots, "states": self.states[slots], "actions": self.actions[slots], "rewards": self.rewards[slots], "dones": self.dones[slots]}
+
+    def flush(self, reserve=0, tag=0):
+        """Write mapped buffers back to their files, returns the metadata restore needs.
+
+        Adds after a flush land in the files too, so the reserve slots about to be overwritten are
+        copied to undo-<tag>.npz for restore to put back. That is the only copy, a few hundred KB,
+        but PrioritizedMemory adds its whole sum tree (16 bytes per slot, 16MB at 1M slots) since
+        priority updates can touch any slot. Needs a Memory with a path."""
+        if self.path is None:
+            raise ValueError("Only a Memory with a path can be flushed")
+        for array in (self.states, self.actions, self.rewards, self.dones):
+            array.flush()
+
+        undo = "undo-%d.npz" % tag
+        np.savez(os.path.join(self.path, undo), **self._undo(reserve))
+        # Keep the previous undo file until the caller has committed to this one
+        for name in os.listdir(self.path):
+            if name.startswith("undo-") and name not in (undo, self.lastUndo):
+                os.remove(os.path.join(self.path, name))
+        self.lastUndo = undo
+        return {"index": self.index, "size": self.size, "undo": undo}
+
+    def restore(self, meta):
+        """ Return a buffer reopened from its files to the flush that produced meta """
+        if self.path is None:
+            raise ValueError("Only a Memory with a path can be restored")
+        self.index = meta["index"]
+        self.size = meta["size"]
+        with np.load(os.path.join(self.path, meta["undo"])) as undo:
+            self._restoreUndo(undo)
+        self.lastUndo = meta["undo"]
+
+    def _restoreUndo(self, undo):
+        slots = undo["slots"]
+        self.states[slots] = undo["states"]
+        self.actions[slots] = undo["actions"]
+        self.rewards[slots] = undo["rewards"]
+        self.dones[slots] = undo["dones"]
+
+    def add(self, sample):  # in (s, a, r, s_) format, s_ is None for terminal states
+        s, a, r, s_ = sample
+        i = self.index
+        self.states[i] = s
+        self.actions[i] = a
+        self.rewards[i] = r
+        self.dones[i] = s_ is None
+
+        self.index = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def addBatch(self, states, actions, rewards, dones):
+        """ Add consecutive transitions at once, the batch must end an episode so next states stay aligned """
+        slots = (self.index + np.arange(len(states))) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.dones[slots] = dones
+
+        self.index = (self.index + len(states)) % self.capacity
+        self.size = min(self.size + len(states), self.capacity)
+
+    def sample(self, n):
+        """ Uniformly sample n transitions as float32 (states, actions, rewards, states_, dones) """
+        # The newest transition has no next state yet unless it ended the episode
+        newest = (self.index - 1) % self.capacity
+        count = self.size if self.dones[newest] else self.size - 1
+        n = min(n, max(count, 0))
+
+        oldest = (self.index - self.size) % self.capacity
+        slots = (oldest + np.array(random.sample(range(count), n), dtype=np.int64)) % self.capacity
+        return self.batch(slots)
+
+    def batch(self, slots):
+        dones = self.dones[slots]
+        states = self.states[slots].astype(np.float32)
+        states_ = self.states[(slots + 1) % self.capacity].astype(np.float32)
+        states_[dones] = 0
+        return states, self.actions[slots], self.rewards[slots], states_, dones
+
+class SumTree:  # binary tree in an array, leaves hold priorities and parents their sums
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.tree = np.zeros(2 * capacity - 1)
+
+    def total(self):
+        return self.tree[0]
+
+    def get(self, slot):
+        return self.tree[slot + self.capacity - 1]
+
+    def update(self, slot, priority):
+        i = slot + self.capacity - 1
+        change = priority - self.tree[i]
+        self.tree[i] = priority
+        while i > 0:
+            i = (i - 1) // 2
+            self.tree[i] += change
+
+    def find(self, s):
+        """ Slot whose cumulative priority range contains s """
+        i = 0
+        while i < self.capacity - 1:
+            left = 2 * i + 1
+            if s < self.tree[left]:
+                i = left
+            else:
+                s -= self.tree[left]
+                i = left + 1
+        return i - (self.capacity - 1)
+
+class PrioritizedMemory(Memory):    # proportional prioritized replay over the same ring buffer
+    def __init__(self, capacity, stateCount, stateDtype=np.int16, alpha=0.6, beta=0.4, betaIncrement=1e-5, epsilon=0.01, path=None):
+        Memory.__init__(self, capacity, stateCount, stateDtype, path)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.betaIncrement = betaIncrement
+        self.epsilon = epsilon
+        self.maxPriority = 1.0
+
+    def add(self, sample):
+        previous = (self.index - 1) % self.capacity
+        slot = self.index
+        Memory.add(self, sample)
+
+        # Transitions only become sampleable once their next state is stored
+        if self.size > 1 and not self.dones[previous]:
+            self.tree.update(previous, self.maxPriority)
+        self.tree.update(slot, self.maxPriority if self.dones[slot] else 0)
+
+    def _undo(self, reserve):
+        # Priority updates can touch any slot, so the whole tree goes into each checkpoint
+        undo = Memory._undo(self, reserve)
+        undo["tree"] = self.tree.tree
+        return undo
+
+    def _restoreUndo(self, undo):
+        Memory._restoreUndo(self, undo)
+        self.tree.tree[:] = undo["tree"]
+
+    def flush(self, reserve=0, tag=0):
+        meta = Memory.flush(self, reserve, tag)
+        meta.update(beta=self.beta, maxPriority=self.maxPriority)
+        return meta
+
+    def restore(self, meta):
+        Memory.restore(self, meta)
+        self.beta = meta["beta"]
+        self.maxPriority = meta["maxPriority"]
+
+    def addBatch(self, states, actions, rewards, dones):
+        for i in range(len(states)):
+            self.add((states[i], actions[i], rewards[i], None if dones[i] else states[i]))
+
+    def sample(self, n):
+        """ Sample n transitions proportionally to priority, plus their slots and importance-sampling weights """
+        total = self.tree.total()
+        count = self.size if self.dones[(self.index - 1) % self.capacity] else self.size - 1
+        n = min(n, max(count, 0))
+        if total <= 0:
+            n = 0
+
+        # One draw per equal segment of the total priority
+        points = (np.arange(n) + np.random.random_sample(n)) * (total / max(n, 1))
+        slots = np.array([self.tree.find(min(s, total * (1 - 1e-12))) for s in points], dtype=np.int64)
+        # Float drift in the sums can land a draw on an empty leaf, weigh it as the lowest priority update gives
+        priorities = np.maximum(self.tree.tree[slots + self.capacity - 1], self.epsilon ** self.alpha)
+
+        self.beta = min(1.0, self.beta + self.betaIncrement)
+        weights = (count * priorities / total) ** -self.beta
+        weights = (weights / weights.max() if n > 0 else weights).astype(np.float32)
+
+        return self.batch(slots) + (slots, weights)
+
+    def update(self, slots, errors):
+        priorities = (np.abs(errors) + self.epsilon) ** self.alpha
+        self.maxPriority = max(self.maxPriority, priorities.max())
+        for slot, priority in zip(slots, priorities):
+            self.tree.update(slot, priority)
@@ -0,0 +1,98 @@
+from __future__ import division
+import json
+import sys
+import time
+from collections import deque
+import numpy as np
+
+class _Phase:
+    """ Accumulates wall time of one training phase, used as a context manager """
+    __slots__ = ("seconds", "calls", "start")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self.start
+        self.calls += 1
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+NULL_PHASE = _NullPhase()
+
+class Metrics:
+    """Phase timers, counters and rolling episode rewards, streamed as one JSON line every N episodes.
+
+    With profile=False phases are shared no-op context managers, so only episode stats cost anything."""
+
+    def __init__(self, path=None, every=50, window=50, profile=True):
+        self.out = open(path, "a") if path is not None else sys.stdout
+        self.every = every
+        self.profile = profile
+        self.rewards = deque(maxlen=window)
+        self.phases = {}
+        self.counters = {}
+        self.episodes = 0
+        self.steps = 0
+        self.startTime = self.lastTime = time.time()
+        self.lastSteps = 0
+
+    def phase(self, name):
+        if not self.profile:
+            return NULL_PHASE
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = _Phase()
+        return phase
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def episode(self, reward, steps, **extra):
+        """ Record a finished episode, writes a record every `every` episodes """
+        self.episodes += 1
+        self.steps += steps
+        self.rewards.append(reward)
+        if self.episodes % self.every == 0:
+            self.write(**extra)
+
+    def write(self, **extra):
+        now = time.time()
+        rewards = np.array(self.rewards)
+        record = {
+            "episode": self.episodes,
+            "steps": self.steps,
+            "seconds": now - self.startTime,
+            "stepsPerSec": (self.steps - self.lastSteps) / max(now - self.lastTime, 1e-9),
+            "reward": {"mean": rewards.mean(), "std": rewards.std(), "min": rewards.min(), "max": rewards.max()},
+            "phases": dict((name, {"seconds": p.seconds, "calls": p.calls, "meanUs": 1e6 * p.seconds / max(p.calls, 1)}) for name, p in self.phases.items()),
+            "counters": dict(self.counters)}
+        record.update(extra)
+        self.out.write(json.dumps(record, default=float) + "\n")
+        self.out.flush()
+
+        # Phases and counters are per record, rewards stay a rolling window
+        self.lastTime, self.lastSteps = now, self.steps
+        for phase in self.phases.values():
+            phase.seconds, phase.calls = 0.0, 0
+        self.counters = {}
+
+    def close(self):
+        if self.out is not sys.stdout:
+            self.out.close()
+
+def nullPhase(name):
+    """ Stands in for Metrics.phase when there is no Metrics """
+    return NULL_PHASE
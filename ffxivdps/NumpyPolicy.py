@@ -0,0 +1,72 @@
+from __future__ import division
+import struct
+import zipfile
+import numpy as np
+
+# Weights of DQNBLM.Brain's Dense -> sigmoid -> Dense network, in forward order
+NAMES = ("W1", "b1", "W2", "b2")
+
+def exportWeights(arrays, path):
+    """ Write W1, b1, W2, b2 (a dict of arrays) as float32 members of an uncompressed .npz """
+    np.savez(path, **dict((name, np.ascontiguousarray(arrays[name], dtype=np.float32)) for name in NAMES))
+
+def _memmapMember(f, path, info):
+    """ Memory map one stored (uncompressed) .npy member of a zip file """
+    # The local header's name and extra field lengths can differ from the central directory's
+    f.seek(info.header_offset + 26)
+    nameLength, extraLength = struct.unpack("<HH", f.read(4))
+    f.seek(info.header_offset + 30 + nameLength + extraLength)
+    version = np.lib.format.read_magic(f)
+    readHeader = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+    shape, fortranOrder, dtype = readHeader(f)
+    return np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape, order="F" if fortranOrder else "C")
+
+def loadWeights(path):
+    """ W1, b1, W2, b2 from an exported .npz, memory mapped when stored uncompressed """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for name in NAMES:
+            info = archive.getinfo(name + ".npy")
+            if info.compress_type == zipfile.ZIP_STORED:
+                arrays[name] = _memmapMember(f, path, info)
+            else:
+                arrays[name] = np.load(archive.open(info))
+    return [arrays[name] for name in NAMES]
+
+class NumpyPolicy:
+    """DQNBLM.Brain's forward pass in NumPy, for evaluating and acting without CNTK.
+
+    forward runs a batch of states through Dense -> sigmoid -> Dense into buffers kept
+    between calls, so the returned Q values are only valid until the next call. predict
+    returns them with Brain.predict's leading sequence dimension."""
+
+    def __init__(self, W1, b1, W2, b2):
+        self.W1, self.b1, self.W2, self.b2 = W1, b1, W2, b2
+        self.hidden = np.empty((0, W1.shape[1]), dtype=np.float32)
+        self.q = np.empty((0, W2.shape[1]), dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        return cls(*loadWeights(path))
+
+    def forward(self, states):
+        states = np.asarray(states, dtype=np.float32).reshape(-1, self.W1.shape[0])
+        count = len(states)
+        if len(self.hidden) < count:
+            self.hidden = np.empty((count, self.W1.shape[1]), dtype=np.float32)
+            self.q = np.empty((count, self.W2.shape[1]), dtype=np.float32)
+        hidden, q = self.hidden[:count], self.q[:count]
+
+        np.dot(states, self.W1, out=hidden)
+        hidden += self.b1
+        # sigmoid as 0.5 * (1 + tanh(x / 2)), which cannot overflow
+        hidden *= 0.5
+        np.tanh(hidden, out=hidden)
+        hidden += 1
+        hidden *= 0.5
+        np.dot(hidden, self.W2, out=q)
+        q += self.b2
+        return q
+
+    def predict(self, s):
+        return self.forward(s)[None]
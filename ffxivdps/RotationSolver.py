@@ -0,0 +1,134 @@
+from __future__ import print_function
+from __future__ import division
+import sys
+import time
+import numpy as np
+from . import BLM
+from .TranspositionTable import TranspositionTable
+
+# Grid for the relaxed bound table, every cast time is a multiple of it
+TIMESTEP = 0.05
+
+class RotationSolver:
+    """Finds the highest potency action sequence for a BLM fight by exhaustive search.
+
+    Depth-first search over BLM._step, memoized in a transposition table on the full
+    quantized state and pruned with an optimistic bound on the potency still reachable
+    in the remaining time."""
+
+    def __init__(self, maxUmbralAstral=3, maxTime=None, quantum=0.01, cacheSize=1000000, job="blm"):
+        self.env = BLM.BLM(maxUmbralAstral, job)
+        if maxTime is not None:
+            self.env.MAXTIME = maxTime
+        self.quantum = quantum
+        self.memo = TranspositionTable(cacheSize)
+
+        self.bounds = self._relaxedBounds()
+
+    def solve(self):
+        """ Returns the optimal rotation (ability indices), its potency and search statistics """
+        startTime = time.time()
+        self.memo.clear()
+        self.nodes = 0
+        self.pruned = 0
+
+        self.env._reset()
+        potency = self._search(-float("inf"))
+
+        # Walk the memoized best actions from the start, searching again where entries were evicted
+        rotation = []
+        self.env._reset()
+        while True:
+            value, exact, action = self.memo.get(self.env.stateKey(self.quantum), (None, False, None))
+            if not exact:
+                self._search(-float("inf"))
+                value, exact, action = self.memo.get(self.env.stateKey(self.quantum))
+            rotation.append(action)
+            state, reward, done, info = self.env._step(action)
+            if done:
+                break
+
+        stats = {
+            "nodes": self.nodes,
+            "cacheHits": self.memo.hits,
+            "pruned": self.pruned,
+            "cacheSize": len(self.memo),
+            "evictions": self.memo.evictions,
+            "seconds": time.time() - startTime}
+        return rotation, potency, stats
+
+    def _relaxedBounds(self):
+        """Best potency of a relaxed fight, indexed by [Astral/Umbral + 3, mana, remaining time / TIMESTEP].
+
+        The relaxation refills mana whenever not in Astral Fire, ignores cooldowns and may wait
+        0.75s for free, so it never scores below the real fight from the same state."""
+        env = self.env
+        steps = int(np.ceil(env.MAXTIME / TIMESTEP)) + 2
+        bounds = np.zeros((7, env.maxMana + 1, steps))
+        mana = np.arange(env.maxMana + 1)
+        castSteps = np.round(env.BASECASTTIME / TIMESTEP).astype(int)
+        waitSteps = int(round(0.75 / TIMESTEP))
+
+        for t in range(1, steps):
+            for column in range(7):
+                effectiveMana = np.full_like(mana, env.maxMana) if column <= 3 else mana
+                best = bounds[column, :, max(0, t - waitSteps)].copy()
+                for action in range(len(env.ABILITIES)):
+                    if env.NEEDSASTRAL[action] and column <= 3:
+                        continue
+                    nextMana = np.minimum(effectiveMana - env.MANACOST[action, column], env.maxMana)
+                    castable = nextMana >= 0
+                    future = bounds[env.NEXTASTRALUMBRAL[action, column] + 3, nextMana.astype(int).clip(0), max(0, t - castSteps[action])]
+                    best = np.where(castable, np.maximum(best, env.POTENCY[action, column] + future), best)
+                bounds[column, :, t] = best
+        return bounds
+
+    def _bound(self):
+        env = self.env
+        column = env.state[-1] + 3
+        mana = env.maxMana if column <= 3 else env.state[-2]
+        # Round remaining time up so float drift in the timer never tightens the bound
+        return self.bounds[column, mana, int(np.ceil((env.MAXTIME - env.timer) / TIMESTEP + 1e-6))]
+
+    def _search(self, need):
+        """ Best future potency from the current env state.
+
+        Exact when it exceeds need, otherwise only an upper bound (fail-soft)."""
+        env = self.env
+        key = env.stateKey(self.quantum)
+        entry = self.memo.get(key)
+        if entry is not None and (entry[1] or entry[0] <= need):
+            return entry[0]
+
+        self.nodes += 1
+        bound = self._bound()
+        if bound <= need:
+            self.pruned += 1
+            if entry is None:
+                self.memo.put(key, (bound, False, None))
+            return bound
+
+        snapshot = env.snapshot()
+        column = env.state[-1] + 3
+        best, bestAction = -float("inf"), None
+
+        # Most potent casts first so the bound cuts early
+        for action in sorted(range(len(env.ABILITIES)), key=lambda a: -env._potency[a][column]):
+            s, reward, done, info = env._step(action)
+            value = reward if done else reward + self._search(max(need, best) - reward)
+            env.restore(snapshot)
+            if value > best:
+                best, bestAction = value, action
+
+        if best > need:
+            self.memo.put(key, (best, True, bestAction))
+        elif entry is None or best < entry[0]:
+            self.memo.put(key, (best, False, None))
+        return best
+
+if __name__ == "__main__":
+    solver = RotationSolver(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
+    rotation, potency, stats = solver.solve()
+    print("Potency: %d" % potency)
+    print(", ".join(solver.env.ABILITIES[a].name for a in rotation))
+    print(stats)
@@ -0,0 +1,168 @@
+from __future__ import print_function
+from __future__ import division
+from collections import OrderedDict
+import numpy as np
+from . import BLM
+
+class TrieNode:
+    """ The fight after a rotation prefix: env snapshot, potency so far and whether it has ended """
+    __slots__ = ("parent", "action", "children", "snapshot", "potency", "done")
+
+    def __init__(self, parent, action, snapshot, potency, done):
+        self.parent = parent
+        self.action = action
+        self.children = {}
+        self.snapshot = snapshot
+        self.potency = potency
+        self.done = done
+
+class RotationTrie:
+    """Scores rotations on BLM, simulating only the part after their longest cached prefix.
+
+    Every evaluated prefix becomes a trie node holding the env snapshot and cumulative
+    potency after it, so rotations sharing a prefix (common openers, GA offspring that differ
+    in one gene) only pay for their new suffix. Beyond capacity nodes the least recently used
+    node is evicted together with its subtree, checked after every evaluate or evaluateMany.
+    hits and misses count steps served from the trie and steps simulated."""
+
+    def __init__(self, maxUmbralAstral=3, capacity=1000000):
+        self.env = BLM.BLM(maxUmbralAstral)
+        self.env._reset()
+        self.root = TrieNode(None, None, self.env.snapshot(), 0.0, False)
+        self.capacity = capacity
+        self.vectorEnv = None
+        self.nodes = OrderedDict() # every node but the root, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evaluations = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _walk(self, rotation):
+        """ Deepest cached node along rotation and how many of its steps that covers """
+        self.evaluations += 1
+        node = self.root
+        nodes = self.nodes
+        length = len(rotation)
+        i = 0
+        while i < length and not node.done:
+            child = node.children.get(rotation[i])
+            if child is None:
+                break
+            node = child
+            nodes.move_to_end(node)
+            i += 1
+        self.hits += i
+        return node, i
+
+    def _add(self, parent, action, snapshot, potency, done):
+        child = parent.children[action] = TrieNode(parent, action, snapshot, potency, done)
+        self.nodes[child] = None
+        self.misses += 1
+        return child
+
+    def evaluate(self, rotation):
+        """ Total potency of a rotation, up to the step that ends the fight """
+        node, i = self._walk(rotation)
+        env = self.env
+        if i < len(rotation) and not node.done:
+            env.restore(node.snapshot)
+            for action in rotation[i:]:
+                state, reward, done, info = env._step(int(action))
+                node = self._add(node, int(action), env.snapshot(), node.potency + reward, done)
+                if done:
+                    break
+            self._evict()
+        return node.potency
+
+    def evaluateMany(self, rotations):
+        """Total potency of each rotation (rows of ability indices).
+
+        The uncached suffixes are simulated together, in lockstep on a BLM.VectorEnv
+        started from each one's cached snapshot."""
+        rotations = [rotation.tolist() if isinstance(rotation, np.ndarray) else list(rotation) for rotation in rotations]
+        potencies = np.zeros(len(rotations))
+        pending = []
+        for row, rotation in enumerate(rotations):
+            node, i = self._walk(rotation)
+            if i == len(rotation) or node.done:
+                potencies[row] = node.potency
+            else:
+                pending.append((row, node, i))
+        if not pending:
+            return potencies
+
+        # One VectorEnv, rebuilt only when more suffixes are pending than ever before. Rows past
+        # count start fresh and step on ability 0, their results are never read.
+        count = len(pending)
+        vectorEnv = self.vectorEnv
+        if vectorEnv is None or vectorEnv.count < count:
+            vectorEnv = self.vectorEnv = BLM.BLM.VectorEnv(count, self.env.maxUmbralAstral, autoReset=False, job=self.env.job)
+            vectorEnv.MAXTIME = self.env.MAXTIME
+        vectorEnv.reset()
+        vectorEnv.states[:count] = [node.snapshot.state for row, node, i in pending]
+        vectorEnv.timer[:count] = [node.snapshot.timer for row, node, i in pending]
+        vectorEnv.nextManaTick[:count] = [node.snapshot.nextManaTick for row, node, i in pending]
+
+        rows = [row for row, node, i in pending]
+        nodes = [node for row, node, i in pending]
+        offsets = [i for row, node, i in pending]
+        running = list(range(count))
+        actions = np.zeros(vectorEnv.count, dtype=np.int64)
+        while running:
+            for j in running:
+                actions[j] = rotations[rows[j]][offsets[j]]
+            states, rewards, dones, info = vectorEnv.step(actions)
+            states, rewards, dones = states.tolist(), rewards.tolist(), dones.tolist()
+            timers, ticks = vectorEnv.timer.tolist(), vectorEnv.nextManaTick.tolist()
+
+            stillRunning = []
+            for j in running:
+                action = int(actions[j])
+                child = nodes[j].children.get(action)
+                if child is None:
+                    child = self._add(nodes[j], action, BLM.BLM.Snapshot(tuple(states[j]), timers[j], ticks[j]), nodes[j].potency + rewards[j], dones[j])
+                else:
+                    # Added by another rotation of this batch
+                    self.nodes.move_to_end(child)
+                    self.hits += 1
+                nodes[j] = child
+                offsets[j] += 1
+                if child.done or offsets[j] == len(rotations[rows[j]]):
+                    potencies[rows[j]] = child.potency
+                else:
+                    stillRunning.append(j)
+            running = stillRunning
+
+        self._evict()
+        return potencies
+
+    def _evict(self):
+        nodes = self.nodes
+        while len(nodes) > self.capacity:
+            node = next(iter(nodes))
+            del node.parent.children[node.action]
+            # The cold branch goes with it
+            stack = [node]
+            while stack:
+                node = stack.pop()
+                del nodes[node]
+                self.evictions += 1
+                stack.extend(node.children.values())
+
+    def clear(self):
+        self.root.children.clear()
+        self.nodes.clear()
+        self.hits = self.misses = self.evictions = self.evaluations = 0
+
+    def stats(self):
+        steps = self.hits + self.misses
+        return {
+            "evaluations": self.evaluations,
+            "nodes": len(self.nodes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / steps if steps else 0.0,
+            "evictions": self.evictions}
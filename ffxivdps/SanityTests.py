@@ -0,0 +1,482 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import importlib.util
+import numpy as np
+from ffxivdps.BLM import BLM, TickBLM
+from ffxivdps import Job
+from ffxivdps.DQNBLM import clearCheckpoint
+from ffxivdps.Memory import Memory, SumTree, PrioritizedMemory
+from ffxivdps.ActorLearner import TransitionRing
+from ffxivdps.Trajectory import TrajectoryWriter, TrajectoryReader
+from ffxivdps.RotationSolver import RotationSolver
+from ffxivdps.ValueIteration import TabularMDP, valueIteration, playPolicy
+from ffxivdps.MCTS import MCTSAgent, playMCTS
+from ffxivdps.Service import RotationEvaluator, BatchingService, Server
+from ffxivdps.Evaluate import evaluatePolicy, playLongFight
+from ffxivdps.NumpyPolicy import NumpyPolicy, exportWeights
+from ffxivdps.RotationTrie import RotationTrie
+from ffxivdps.GeneticSearch import evaluateRotations
+from ReinforcementLearning.BlmEnvironment import BlmEnvironment
+
+class SanityTests(unittest.TestCase):
+	def testDoubleFire(self):
+		blm = BLM(1)
+		blm._reset()
+		# Fire 1 from Neutral enters Astral Fire, the second one gets its 1.4x and costs double
+		state, potency, done, d = blm._step(1)
+		self.assertEqual((potency, state[-2], state[-1]), (180, 301, 1))
+
+		state, potency, done, d = blm._step(1)
+		self.assertAlmostEqual(potency, 180 * 1.4)
+		self.assertEqual((state[-2], state[-1]), (271, 1))
+
+	def testVectorEnvMatchesStep(self):
+		random = np.random.RandomState(0)
+		vectorEnv = BLM.VectorEnv(16, 3)
+		envs = [BLM(3) for i in range(16)]
+
+		for step in range(500):
+			actions = random.randint(0, len(envs[0].ABILITIES), size=len(envs))
+			states, rewards, dones, info = vectorEnv.step(actions)
+
+			for i in range(len(envs)):
+				state, reward, done, d = envs[i]._step(int(actions[i]))
+				if done:
+					state = envs[i]._reset()
+				self.assertEqual(state.tolist(), states[i].tolist())
+				self.assertEqual(reward, rewards[i])
+				self.assertEqual(done, dones[i])
+				self.assertEqual(envs[i].timer, vectorEnv.timer[i])
+
+	def testSnapshotRestore(self):
+		blm = BLM(3)
+		for action in [4, 0, 1, 3, 5]:
+			blm._step(action)
+		snapshot = blm.snapshot()
+
+		# BLM steps its state in place, so record it as we go
+		first = [(blm._step(action)[0].tolist(), blm.timer) for action in [5, 2, 0, 3, 5]]
+		blm.restore(snapshot)
+		self.assertEqual(snapshot.key(), blm.stateKey())
+		second = [(blm._step(action)[0].tolist(), blm.timer) for action in [5, 2, 0, 3, 5]]
+		self.assertEqual(first, second)
+
+	def testTrajectoryRoundTrip(self):
+		blm = BLM(3)
+		blm._reset()
+		path = os.path.join(tempfile.mkdtemp(), "trajectory.npy")
+		steps = []
+		with TrajectoryWriter(path, len(blm.initialState) - 2, chunkSize=7) as writer:
+			for action in [4, 0, 1, 3, 5] * 10:
+				state, reward, done, d = blm._step(action)
+				writer.record(action, reward, state, blm.timer, done)
+				steps.append((action, reward, state[-2], state[-1]))
+				if done:
+					blm._reset()
+
+		reader = TrajectoryReader(path)
+		self.assertEqual(len(reader), len(steps))
+		self.assertEqual(steps, list(zip(reader.field("action"), reader.field("potency"), reader.field("mana"), reader.field("astralUmbral"))))
+		self.assertEqual(len(np.load(path)), len(steps))
+
+	def testTrajectoryResumeNumbersEpisodes(self):
+		path = os.path.join(tempfile.mkdtemp(), "trajectory.npy")
+		state = BLM(3)._reset()
+		# A resumed run without a trajectory file yet
+		with TrajectoryWriter(path, len(state) - 2, append=True, episode=7) as writer:
+			writer.record(0, 180, state, 2.5, True)
+		with TrajectoryWriter(path, len(state) - 2, append=True, episode=8) as writer:
+			writer.record(0, 180, state, 2.5, True)
+		self.assertEqual(TrajectoryReader(path).field("episode").tolist(), [7, 8])
+
+	def testMemoryWrapsAroundAndMasksTerminals(self):
+		memory = Memory(5, 2)
+		# Transition k has state [k, -k] and action k, the episode ends at 3
+		for k in range(8):
+			memory.add(([k, -k], k, k, None if k == 3 else [k + 1, -k - 1]))
+		self.assertEqual((len(memory), memory.index), (5, 3))
+
+		# 3..7 are kept, 7 has no next state yet
+		states, actions, rewards, states_, dones = memory.sample(100)
+		self.assertEqual(sorted(actions.tolist()), [3, 4, 5, 6])
+		for state, action, state_, done in zip(states, actions, states_, dones):
+			self.assertEqual(state.tolist(), [action, -action])
+			self.assertEqual(done, action == 3)
+			self.assertEqual(state_.tolist(), [0, 0] if done else [action + 1, -action - 1])
+
+		# Once the episode ends the newest transition is sampleable too
+		memory.add(([8, -8], 8, 8, None))
+		self.assertEqual(sorted(memory.sample(100)[1].tolist()), [4, 5, 6, 7, 8])
+
+	def testSumTreeFindsPrefixSums(self):
+		tree = SumTree(4)
+		for slot, priority in enumerate([1.0, 2.0, 0.0, 3.0]):
+			tree.update(slot, priority)
+		self.assertEqual(tree.total(), 6.0)
+		self.assertEqual([tree.find(s) for s in [0.0, 0.99, 1.0, 2.99, 3.0, 5.99]], [0, 0, 1, 1, 3, 3])
+		tree.update(1, 0.5)
+		self.assertEqual(tree.total(), 4.5)
+		self.assertEqual((tree.find(1.49), tree.find(1.5)), (1, 3))
+
+	def testPrioritizedMemoryPrioritiesAndWeights(self):
+		memory = PrioritizedMemory(8, 1, beta=0.5, betaIncrement=0)
+		memory.add(([0], 0, 0, [1]))
+		# Unfinished transitions have no next state yet, so they cannot be drawn
+		self.assertEqual((memory.tree.get(0), memory.tree.total()), (0, 0))
+		memory.add(([1], 1, 0, [2]))
+		memory.add(([2], 2, 0, None))
+		self.assertEqual([memory.tree.get(slot) for slot in range(3)], [1.0, 1.0, 1.0])
+
+		memory.update(np.array([0, 1, 2]), np.array([0.0, 1.0, 3.0]))
+		priorities = (np.array([0.0, 1.0, 3.0]) + memory.epsilon) ** memory.alpha
+		self.assertAlmostEqual(memory.tree.total(), priorities.sum())
+		self.assertEqual(memory.maxPriority, priorities.max())
+
+		states, actions, rewards, states_, dones, slots, weights = memory.sample(30)
+		expected = (3 * priorities[slots] / priorities.sum()) ** -0.5
+		np.testing.assert_allclose(weights, expected / expected.max(), rtol=1e-6)
+		self.assertEqual(weights.max(), 1.0)
+
+		# A draw on a leaf the sums still count must not turn the weights into inf or NaN
+		memory.tree.tree[2 + memory.capacity - 1] = 0
+		self.assertTrue(np.all(np.isfinite(memory.sample(30)[-1])))
+
+	def testMemoryRestoresToFlush(self):
+		for memoryClass in (Memory, PrioritizedMemory):
+			path = tempfile.mkdtemp()
+			memory = memoryClass(8, 2, path=path)
+			for k in range(11):
+				memory.add(([k, -k], k, k, None if k % 4 == 3 else [k + 1, -k - 1]))
+			meta = memory.flush(reserve=6, tag=1)
+			flushed = [array.copy() for array in (memory.states, memory.actions, memory.rewards, memory.dones)]
+			tree = memory.tree.tree.copy() if memoryClass is PrioritizedMemory else None
+
+			# These land in the mapped files past the flush, overwriting kept slots
+			for k in range(11, 17):
+				memory.add(([k, -k], k, k, None if k % 4 == 3 else [k + 1, -k - 1]))
+			for array in (memory.states, memory.actions, memory.rewards, memory.dones):
+				array.flush()
+			del memory
+
+			memory = memoryClass(8, 2, path=path)
+			memory.restore(meta)
+			self.assertEqual((memory.index, memory.size), (meta["index"], meta["size"]))
+			for array, expected in zip((memory.states, memory.actions, memory.rewards, memory.dones), flushed):
+				np.testing.assert_array_equal(array, expected)
+			if tree is not None:
+				np.testing.assert_array_equal(memory.tree.tree, tree)
+
+	def testUnmappedMemoryCannotFlush(self):
+		for memoryClass in (Memory, PrioritizedMemory):
+			memory = memoryClass(8, 2)
+			memory.add(([0, 0], 0, 0, None))
+			with self.assertRaises(ValueError):
+				memory.flush()
+			with self.assertRaises(ValueError):
+				memory.restore({"index": 0, "size": 0, "undo": "undo-0.npz", "beta": 0.4, "maxPriority": 1.0})
+
+	def testFreshRunClearsCheckpoint(self):
+		path = tempfile.mkdtemp()
+		memory = Memory(8, 2, path=os.path.join(path, "memory"))
+		for k in range(5):
+			memory.add(([k, -k], k, k, None))
+		memory.flush(reserve=4, tag=1)
+		del memory
+		for name in ("state.pkl", "trainer-500.dnn", "trainer-500.dnn.target", "metrics.jsonl"):
+			open(os.path.join(path, name), "w").close()
+
+		clearCheckpoint(path)
+		self.assertEqual(os.listdir(path), ["metrics.jsonl"])
+		memory = Memory(8, 2, path=os.path.join(path, "memory"))
+		self.assertFalse(memory.states.any() or memory.actions.any())
+
+	def testTransitionRingWrapsAround(self):
+		import multiprocessing as mp
+		ring, stop = TransitionRing(8, 3), mp.Event()
+		self.assertIsNone(ring.take())
+		for start in (0, 5, 10):
+			states = np.arange(start * 3, (start + 5) * 3, dtype=np.int16).reshape(5, 3)
+			dones = [False, True, False, False, True]
+			self.assertTrue(ring.write(states, range(start, start + 5), [1.5] * 5, dones, [1, 2, 3, 4, 5], stop))
+			got = ring.take()
+			np.testing.assert_array_equal(got[0], states)
+			np.testing.assert_array_equal(got[1], range(start, start + 5))
+			np.testing.assert_array_equal(got[3], dones)
+			self.assertEqual(got[4], [2, 5])
+			self.assertIsNone(ring.take())
+
+		# A full ring gives up once stop is set instead of overwriting unread slots
+		self.assertTrue(ring.write(states, range(5), [0] * 5, dones, [0] * 5, stop))
+		stop.set()
+		self.assertFalse(ring.write(states, range(5), [0] * 5, dones, [0] * 5, stop))
+		self.assertEqual(len(ring.take()[0]), 5)
+
+	def testJobCache(self):
+		cache = tempfile.mkdtemp()
+		compiled = Job.load("blm", 3, cache=None)
+		for attempt in range(2):
+			job = Job.load("blm", 3, cache=cache)
+			for name in Job.TABLES:
+				np.testing.assert_array_equal(getattr(job, name), getattr(compiled, name))
+		entries = os.listdir(cache)
+		self.assertEqual(len(entries), 1)
+
+		# An unreadable entry is compiled again
+		with open(os.path.join(cache, entries[0]), "wb") as f:
+			f.write(b"not a zip")
+		np.testing.assert_array_equal(Job.load("blm", 3, cache=cache).POTENCY, compiled.POTENCY)
+		self.assertEqual(os.listdir(cache), entries)
+
+		# Editing the spec changes the key
+		with open(Job.specPath("blm")) as f:
+			spec = json.load(f)
+		spec["abilities"][0]["potency"] += 1
+		path = os.path.join(tempfile.mkdtemp(), "edited.json")
+		with open(path, "w") as f:
+			json.dump(spec, f)
+		edited = Job.load(path, 3, cache=cache)
+		self.assertEqual(len(os.listdir(cache)), 2)
+		self.assertFalse(np.array_equal(edited.POTENCY, compiled.POTENCY))
+
+		# A cache that cannot be created is only a slower start
+		blocker = os.path.join(cache, entries[0])
+		np.testing.assert_array_equal(Job.load("blm", 3, cache=os.path.join(blocker, "cache")).POTENCY, compiled.POTENCY)
+
+	def testJobsCoexist(self):
+		with open(Job.specPath("blm")) as f:
+			spec = json.load(f)
+		spec["maxMana"], spec["manaTick"] = 1000, 5
+		path = os.path.join(tempfile.mkdtemp(), "bigmana.json")
+		with open(path, "w") as f:
+			json.dump(spec, f)
+
+		actions = [4, 0, 0, 0, 0, 0, 0, 0]
+		def play(env):
+			env._reset()
+			return [(env._step(action)[0].tolist(), env.timer, env.nextManaTick) for action in actions]
+		def playVector(vectorEnv):
+			vectorEnv.reset()
+			return [vectorEnv.step(np.array([action]))[0][0].tolist() for action in actions]
+		expected = [play(BLM(3)), play(TickBLM(3)), playVector(BLM.VectorEnv(1, 3))]
+
+		envs = [BLM(3), TickBLM(3), BLM.VectorEnv(1, 3)]
+		other = BLM(3, job=path)
+		self.assertEqual([play(envs[0]), play(envs[1]), playVector(envs[2])], expected)
+		self.assertEqual((other.initialState[-2], other._reset()[-2], other.nextManaTick), (1000, 1000, 4.9))
+		self.assertTrue(max(state[-2] for state, timer, tick in play(other)) <= 1000)
+
+	def testValueIterationMatchesSolver(self):
+		mdp = TabularMDP(3, maxTime=15).build()
+		values, policy, iterations = valueIteration(mdp)
+		rotation, potency, stats = RotationSolver(3, maxTime=15).solve()
+		self.assertAlmostEqual(values[mdp.start, -1], potency, places=2)
+		self.assertEqual(playPolicy(mdp, policy)[0], potency)
+
+	def testPlayPolicyKeepsTheMDPsRules(self):
+		mdp = TabularMDP(1, maxTime=12).build()
+		values, policy, iterations = valueIteration(mdp)
+		BLM(3)
+		potency, rotation, misses = playPolicy(mdp, policy)
+		self.assertAlmostEqual(values[mdp.start, -1], potency, places=2)
+		self.assertEqual(misses, 0)
+
+	def testMCTSFindsShortRotation(self):
+		blm = BLM(3)
+		blm.MAXTIME = 15
+		potency, agent = playMCTS(blm, iterations=200, seed=0)
+		self.assertEqual(potency, RotationSolver(3, maxTime=15).solve()[1])
+		self.assertGreater(agent.reused, 0)
+
+	def testMCTSNeedsABudget(self):
+		with self.assertRaises(ValueError):
+			MCTSAgent(BLM(3), iterations=None, seconds=None)
+
+	def testMCTSSimulatesItsEnvsRules(self):
+		blm = BLM(1)
+		BLM(3)
+		agent = MCTSAgent(blm)
+		self.assertIs(agent.sim.job, blm.job)
+		np.testing.assert_array_equal(agent.sim.NEXTASTRALUMBRAL, blm.NEXTASTRALUMBRAL)
+
+	def testRotationEvaluatorMatchesStep(self):
+		random = np.random.RandomState(0)
+		rotations = [random.randint(0, 6, size=random.randint(0, 40)).tolist() for i in range(32)]
+		results = RotationEvaluator(3).evaluate(rotations)
+		for rotation, result in zip(rotations, results):
+			blm = BLM(3)
+			blm._reset()
+			potency, failures, steps = 0, [], 0
+			for step, action in enumerate(rotation):
+				state, reward, done, d = blm._step(action)
+				potency += reward
+				steps += 1
+				if d["Invalid"]:
+					failures.append(step)
+				if done:
+					break
+			self.assertEqual((potency, steps), (result["potency"], result["steps"]))
+			self.assertEqual(failures, [failure["step"] for failure in result["failures"]])
+
+	def testRotationEvaluatorKeepsOneVectorEnv(self):
+		random = np.random.RandomState(4)
+		rotations = [random.randint(0, 6, size=random.randint(1, 30)).tolist() for i in range(20)]
+		expected = [result["potency"] for result in RotationEvaluator(3).evaluate(rotations, [False] * 20)]
+		evaluator = RotationEvaluator(3, maxRows=8)
+		for count in (20, 3, 7, 1, 20):
+			self.assertEqual([result["potency"] for result in evaluator.evaluate(rotations[:count], [False] * count)], expected[:count])
+		self.assertEqual(evaluator.vectorEnv.count, 8)
+
+	def testRotationTrieMatchesVectorEnv(self):
+		random = np.random.RandomState(2)
+		rotations = random.randint(0, 6, size=(64, 60))
+		trie = RotationTrie(3, capacity=500)
+		for generation in range(3):
+			np.testing.assert_array_equal(trie.evaluateMany(rotations), evaluateRotations(rotations, 3))
+			self.assertEqual(trie.evaluate(rotations[0].tolist()), evaluateRotations(rotations[:1], 3)[0])
+			self.assertLessEqual(len(trie), 500)
+			# Mutate one gene per rotation, as GA offspring do
+			rotations = rotations.copy()
+			rotations[np.arange(64), random.randint(0, 60, size=64)] = random.randint(0, 6, size=64)
+		self.assertGreater(trie.hits, 0)
+		self.assertGreater(trie.evictions, 0)
+		# Smaller batches of pending suffixes reuse the first generation's VectorEnv
+		self.assertEqual(trie.vectorEnv.count, 64)
+
+	def testRotationTrieKeepsItsMaxUmbralAstral(self):
+		rotations = np.random.RandomState(4).randint(0, 6, size=(32, 40))
+		tries = dict((maxUmbralAstral, RotationTrie(maxUmbralAstral)) for maxUmbralAstral in (1, 3))
+		expecteds = dict((maxUmbralAstral, evaluateRotations(rotations, maxUmbralAstral)) for maxUmbralAstral in (1, 3))
+		for maxUmbralAstral, trie in tries.items():
+			# Later envs must not change the rules of earlier ones
+			BLM(2)
+			expected = expecteds[maxUmbralAstral]
+			np.testing.assert_array_equal(trie.evaluateMany(rotations), expected)
+			trie.clear()
+			self.assertEqual(trie.evaluate(rotations[0].tolist()), expected[0])
+
+	def testBlmEnvironmentMatchesStep(self):
+		random = np.random.RandomState(3)
+		adapter = BlmEnvironment(3)
+		self.assertEqual(adapter.states["shape"], (8,))
+		self.assertEqual(adapter.actions["num_actions"], 6)
+		for episode in range(3):
+			blm = BLM(3)
+			state = adapter.reset()
+			np.testing.assert_array_equal(state, blm._reset())
+			while True:
+				action = random.randint(6)
+				state, reward, terminal = adapter.execute(action)
+				expected, expectedReward, done, d = blm._step(action)
+				np.testing.assert_array_equal(state, expected)
+				self.assertEqual((reward, terminal), (expectedReward, done))
+				if terminal:
+					break
+
+	def testBatchingServiceSurvivesEmptyRequests(self):
+		async def run():
+			service = BatchingService(RotationEvaluator(3))
+			service.start()
+			server = Server(service)
+			status, response = await server.route("POST", "/evaluate", b'{"rotations": []}')
+			self.assertEqual((status, response), (200, {"results": []}))
+			status, response = await server.route("POST", "/evaluate", ('{"rotation": %s}' % ([5] * 1000)).encode("utf-8"))
+			self.assertEqual(status, 400)
+			results = await asyncio.wait_for(service.evaluate([[5, 3, 5]], trace=False), 5)
+			self.assertFalse(service.task.done())
+			await service.stop()
+			return results
+		results = asyncio.run(run())
+		self.assertEqual(results[0]["steps"], 3)
+		evaluator = RotationEvaluator(3)
+		self.assertEqual(evaluator.evaluate([[5] * 1000], [False])[0]["steps"], evaluator.evaluate([[5] * evaluator.maxSteps], [False])[0]["steps"])
+
+	def testServerRejectsBoolsAndLargeBodies(self):
+		evaluator = RotationEvaluator(3)
+		for rotation in ([True, 5], [5, False]):
+			with self.assertRaises(ValueError):
+				evaluator.parse(rotation)
+
+		async def request(server, body, length):
+			listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+			reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+			writer.write(b"POST /evaluate HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % length + body)
+			status = (await reader.readline()).split()[1]
+			writer.close()
+			listener.close()
+			await listener.wait_closed()
+			return int(status)
+		async def run():
+			service = BatchingService(evaluator)
+			service.start()
+			server = Server(service, maxBody=64)
+			body = b'{"rotation": [5, 3, 5]}'
+			statuses = [await request(server, body, len(body)), await request(server, b"", 65)]
+			await service.stop()
+			return statuses
+		self.assertEqual(asyncio.run(run()), [200, 413])
+
+	def testEvaluatePolicyMatchesStep(self):
+		weights = np.random.RandomState(1).randn(8, 6).astype(np.float32)
+		class LinearBrain:
+			def predict(self, s):
+				return (np.atleast_2d(s) / 100 @ weights)[None]
+		brain = LinearBrain()
+
+		blm = BLM(3)
+		state = blm._reset()
+		potency, done = 0, False
+		while not done:
+			state, reward, done, d = blm._step(int(np.argmax(brain.predict(state.astype(np.float32))[0])))
+			potency += reward
+
+		potencies = evaluatePolicy(brain, episodes=40, envCount=16)
+		self.assertEqual(len(potencies), 40)
+		self.assertTrue((potencies == potency).all())
+
+	def testLongFightMatchesStep(self):
+		cycles = 0
+		for seed in range(5):
+			weights = np.random.RandomState(seed).randn(8, 6)
+			policy = lambda state: int(np.argmax(state.dot(weights)))
+			for env in (BLM(3), TickBLM(3)):
+				result = playLongFight(env, policy, 600)
+				self.assertEqual(env.MAXTIME, BLM(3).MAXTIME)
+				env.MAXTIME = 600
+				env._reset()
+				potency, steps, done = 0, 0, False
+				while not done:
+					state, reward, done, d = env._step(policy(env.state))
+					potency += reward
+					steps += 1
+				self.assertEqual((potency, steps), (result["potency"], result["steps"]))
+				if result["cycle"] is not None:
+					cycles += 1
+					self.assertLess(result["simulated"], steps)
+		self.assertGreater(cycles, 0)
+
+	def testNumpyPolicyRoundTrip(self):
+		random = np.random.RandomState(0)
+		weights = dict(W1=random.randn(8, 4), b1=random.randn(4), W2=random.randn(4, 6), b2=random.randn(6))
+		path = os.path.join(tempfile.mkdtemp(), "weights.npz")
+		exportWeights(weights, path)
+		policy = NumpyPolicy.load(path)
+		self.assertIsInstance(policy.W1, np.memmap)
+
+		states = random.randint(0, 316, size=(5, 8))
+		hidden = 1 / (1 + np.exp(-(states.dot(weights["W1"]) + weights["b1"])))
+		np.testing.assert_allclose(policy.forward(states), hidden.dot(weights["W2"]) + weights["b2"], rtol=1e-4, atol=1e-4)
+
+	@unittest.skipIf(importlib.util.find_spec("cntk") is None, "needs CNTK")
+	def testNumpyPolicyMatchesBrain(self):
+		from ffxivdps.DQNBLM import Brain
+		brain = Brain()
+		path = os.path.join(tempfile.mkdtemp(), "weights.npz")
+		brain.export(path)
+		states = np.random.RandomState(0).randint(0, 316, size=(64, 8)).astype(np.float32)
+		np.testing.assert_allclose(NumpyPolicy.load(path).predict(states), brain.predict(states), rtol=1e-4, atol=1e-4)
+
+if __name__ == '__main__':
+	unittest.main()
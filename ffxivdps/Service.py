@@ -0,0 +1,308 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import asyncio
+import collections
+import json
+import math
+import time
+import numpy as np
+from . import BLM
+
+class RotationEvaluator:
+    """Plays a batch of rotations on a BLM.VectorEnv, one row per rotation.
+
+    Rotations may differ in length. A row stops at the end of its rotation or when the
+    fight ends, whichever comes first. No fight lasts more than maxSteps steps, so parse
+    rejects longer rotations and evaluate ignores anything past that. Batches are played
+    maxRows rotations at a time on one VectorEnv, grown to the largest batch so far, with
+    the rows a smaller batch leaves over masked out."""
+
+    def __init__(self, maxUmbralAstral=3, maxRows=512):
+        self.maxUmbralAstral = maxUmbralAstral
+        self.maxRows = maxRows
+        self.vectorEnv = None
+        env = BLM.BLM(maxUmbralAstral)
+        self.names = [ability.name for ability in env.ABILITIES]
+        self.indices = dict((name.lower(), i) for i, name in enumerate(self.names))
+        # Every step takes at least 0.75s
+        self.maxSteps = int(math.ceil(env.MAXTIME / 0.75)) + 1
+
+    def parse(self, rotation):
+        """ Ability indices of a rotation given as indices or names, ValueError if one is unknown or it is too long """
+        if len(rotation) > self.maxSteps:
+            raise ValueError("Rotation of %d steps, a fight takes at most %d" % (len(rotation), self.maxSteps))
+        actions = []
+        for action in rotation:
+            if isinstance(action, str):
+                if action.lower() not in self.indices:
+                    raise ValueError("Unknown ability %r" % action)
+                action = self.indices[action.lower()]
+            # bool is an int subclass, but true/false in JSON are never ability indices
+            if not isinstance(action, int) or isinstance(action, bool) or not 0 <= action < len(self.names):
+                raise ValueError("Invalid ability %r" % (action,))
+            actions.append(action)
+        return actions
+
+    def _vectorEnv(self, count):
+        """ The VectorEnv, rebuilt with count rows when a batch is larger than any before """
+        if self.vectorEnv is None or self.vectorEnv.count < count:
+            self.vectorEnv = BLM.BLM.VectorEnv(count, self.maxUmbralAstral, autoReset=False)
+        return self.vectorEnv
+
+    def evaluate(self, rotations, traces=None):
+        """ Result dicts for rotations (lists of ability indices), with per-step traces where traces[i] """
+        if len(rotations) > self.maxRows:
+            results = []
+            for start in range(0, len(rotations), self.maxRows):
+                results += self.evaluate(rotations[start:start + self.maxRows], None if traces is None else traces[start:start + self.maxRows])
+            return results
+
+        rotations = [rotation[:self.maxSteps] for rotation in rotations]
+        count = len(rotations)
+        vectorEnv = self._vectorEnv(count)
+        vectorEnv.reset()
+
+        # Rows past count have length 0, so they never count as running
+        lengths = np.array([len(rotation) for rotation in rotations])
+        actions = np.zeros((vectorEnv.count, max(1, lengths.max())), dtype=np.int64)
+        for i, rotation in enumerate(rotations):
+            actions[i, :len(rotation)] = rotation
+
+        steps = actions.shape[1]
+        rewards = np.zeros((count, steps))
+        invalid = np.zeros((count, steps), dtype=bool)
+        mana = np.zeros((count, steps), dtype=np.int64)
+        astralUmbral = np.zeros((count, steps), dtype=np.int64)
+        timers = np.zeros((count, steps))
+        played = np.zeros(count, dtype=np.int64)
+        running = lengths > 0
+        for t in range(steps):
+            states, reward, dones, info = vectorEnv.step(actions[:, t])
+            rewards[:, t] = reward[:count]
+            invalid[:, t] = info["Invalid"][:count]
+            mana[:, t] = states[:count, -2]
+            astralUmbral[:, t] = states[:count, -1]
+            timers[:, t] = vectorEnv.timer[:count]
+            played += running
+            running &= ~dones[:count] & (t + 1 < lengths)
+            if not running.any():
+                break
+
+        results = []
+        for i in range(count):
+            n = played[i]
+            potency = float(rewards[i, :n].sum())
+            timer = float(timers[i, n - 1]) if n else 0.0
+            result = {
+                "potency": potency,
+                "dps": potency / timer if timer else 0.0,
+                "time": timer,
+                "steps": int(n),
+                "finished": bool(n and timer >= vectorEnv.MAXTIME),
+                "failures": [{"step": int(t), "ability": self.names[actions[i, t]]} for t in np.flatnonzero(invalid[i, :n])]}
+            if traces is None or traces[i]:
+                result["trace"] = [{"ability": self.names[a], "potency": r, "mana": m, "astralUmbral": au, "time": seconds, "invalid": bad}
+                                   for a, r, m, au, seconds, bad in zip(actions[i, :n].tolist(), rewards[i, :n].tolist(), mana[i, :n].tolist(),
+                                                                      astralUmbral[i, :n].tolist(), timers[i, :n].tolist(), invalid[i, :n].tolist())]
+            results.append(result)
+        return results
+
+class QueueFull(Exception):
+    pass
+
+class BatchingService:
+    """Coalesces concurrent rotation evaluations into micro-batches for a RotationEvaluator.
+
+    A batch is cut at maxBatch rotations or maxDelay seconds after its first one arrived.
+    At most maxQueue rotations wait at once, submit raises QueueFull beyond that. Latency
+    from submit to result is kept for the last window requests."""
+
+    def __init__(self, evaluator, maxBatch=512, maxDelay=0.002, maxQueue=8192, window=10000):
+        self.evaluator = evaluator
+        self.maxBatch = maxBatch
+        self.maxDelay = maxDelay
+        self.maxQueue = maxQueue
+        self.queue = collections.deque()
+        self.ready = asyncio.Event()
+        self.latencies = collections.deque(maxlen=window)
+        self.evaluations = 0
+        self.batches = 0
+        self.rejected = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def submit(self, rotations, trace=True):
+        """ Queue rotations (ability index lists) for evaluation, returns a future per rotation """
+        if not rotations:
+            return []
+        if len(self.queue) + len(rotations) > self.maxQueue:
+            self.rejected += len(rotations)
+            raise QueueFull()
+        loop = asyncio.get_event_loop()
+        futures = []
+        now = time.perf_counter()
+        for rotation in rotations:
+            future = loop.create_future()
+            self.queue.append((rotation, trace, future, now))
+            futures.append(future)
+        self.ready.set()
+        return futures
+
+    async def evaluate(self, rotations, trace=True):
+        return await asyncio.gather(*self.submit(rotations, trace))
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await self.ready.wait()
+            if not self.queue:
+                self.ready.clear()
+                continue
+            # Give concurrent requests until maxDelay to join, unless the batch is already full
+            deadline = self.queue[0][3] + self.maxDelay
+            while len(self.queue) < self.maxBatch and time.perf_counter() < deadline:
+                await asyncio.sleep(min(0.0005, max(0.0, deadline - time.perf_counter())))
+
+            batch = [self.queue.popleft() for _ in range(min(self.maxBatch, len(self.queue)))]
+            if not self.queue:
+                self.ready.clear()
+
+            # Off the event loop, so connections keep being served while numpy runs
+            try:
+                results = await loop.run_in_executor(None, self.evaluator.evaluate, [item[0] for item in batch], [item[1] for item in batch])
+            except Exception as e:
+                for item in batch:
+                    if not item[2].done():
+                        item[2].set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            for (rotation, trace, future, submitted), result in zip(batch, results):
+                self.latencies.append(now - submitted)
+                if not future.done():
+                    future.set_result(result)
+            self.evaluations += len(batch)
+            self.batches += 1
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "evaluations": self.evaluations,
+            "batches": self.batches,
+            "meanBatch": self.evaluations / self.batches if self.batches else 0.0,
+            "queued": len(self.queue),
+            "rejected": self.rejected,
+            "p50ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "p99ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+class Server:
+    """Minimal HTTP/1.1 front end of a BatchingService, over TCP or a Unix socket.
+
+    POST /evaluate takes {"rotations": [[...], ...]} (or "rotation": [...]) with abilities
+    as indices or names, and "trace": false to leave out the per-step traces. It answers
+    {"results": [...]} in the same order. GET /stats returns the service's counters and
+    latency percentiles. A full queue answers 503, a body over maxBody bytes 413 without
+    being read."""
+
+    def __init__(self, service, maxBody=1 << 20):
+        self.service = service
+        self.maxBody = maxBody
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                method, path, version = requestLine.decode("latin1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length < 0:
+                    raise ValueError("Negative Content-Length")
+
+                # The unread body would be parsed as the next request, so close after a 413
+                if length > self.maxBody:
+                    status, response = 413, {"error": "Body of %d bytes, at most %d" % (length, self.maxBody)}
+                    keepAlive = False
+                else:
+                    body = await reader.readexactly(length)
+                    status, response = await self.route(method, path, body)
+                    keepAlive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                payload = json.dumps(response).encode("utf-8")
+                writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n" % (
+                    status, REASONS[status], len(payload), "keep-alive" if keepAlive else "close")).encode("latin1") + payload)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if path == "/stats":
+            return 200, self.service.stats()
+        if path != "/evaluate":
+            return 404, {"error": "Not found"}
+        if method != "POST":
+            return 405, {"error": "Use POST"}
+        try:
+            request = json.loads(body.decode("utf-8"))
+            rotations = request["rotations"] if "rotations" in request else [request["rotation"]]
+            rotations = [self.service.evaluator.parse(rotation) for rotation in rotations]
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": str(e)}
+        try:
+            results = await self.service.evaluate(rotations, bool(request.get("trace", True)))
+        except QueueFull:
+            return 503, {"error": "Queue full, retry later"}
+        return 200, {"results": results}
+
+async def serve(maxUmbralAstral=3, host="127.0.0.1", port=8765, unixPath=None, maxBody=1 << 20, **settings):
+    service = BatchingService(RotationEvaluator(maxUmbralAstral, settings.get("maxBatch", 512)), **settings)
+    service.start()
+    server = Server(service, maxBody)
+    if unixPath is not None:
+        listener = await asyncio.start_unix_server(server.handle, path=unixPath)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+    print("Serving on %s" % (unixPath or "http://%s:%d" % (host, port)))
+    async with listener:
+        await listener.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve BLM rotation evaluations over HTTP")
+    parser.add_argument("maxUmbralAstral", type=int, nargs="?", default=3)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="listen on a Unix socket at this path instead")
+    parser.add_argument("--max-batch", type=int, default=512)
+    parser.add_argument("--max-delay", type=float, default=0.002, help="seconds a batch waits for more requests")
+    parser.add_argument("--max-queue", type=int, default=8192)
+    parser.add_argument("--max-body", type=int, default=1 << 20, help="largest request body in bytes, larger ones get 413")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.maxUmbralAstral, args.host, args.port, args.unix, args.max_body,
+                          maxBatch=args.max_batch, maxDelay=args.max_delay, maxQueue=args.max_queue))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,138 @@
+from __future__ import division
+import os
+import struct
+import numpy as np
+
+# The file is a .npy of structured records whose header is padded to a fixed size,
+# so the writer can rewrite the record count in place after every chunk
+HEADER_SIZE = 256
+MAGIC = b"\x93NUMPY\x01\x00"
+
+def trajectoryDtype(cooldownCount):
+    """ One record per step, taken after the step: what was cast, what it did and the state it left """
+    return np.dtype([
+        ("episode", np.uint32),
+        ("t", np.uint16),
+        ("action", np.int8),
+        ("astralUmbral", np.int8),
+        ("mana", np.int16),
+        ("potency", np.float32),
+        ("timer", np.float32),
+        ("cooldowns", np.float32, (cooldownCount,))])
+
+def _header(dtype, count):
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (count,)})
+    padding = HEADER_SIZE - len(MAGIC) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError("Record dtype too large for the trajectory header")
+    return MAGIC + struct.pack("<H", HEADER_SIZE - len(MAGIC) - 2) + (header + " " * padding + "\n").encode("latin1")
+
+def _readHeader(f):
+    """ dtype and data offset of a trajectory file, the record count comes from the file size """
+    np.lib.format.read_magic(f)
+    shape, fortranOrder, dtype = np.lib.format.read_array_header_1_0(f)
+    return dtype, f.tell()
+
+class TrajectoryWriter:
+    """Streams BLM steps into a trajectory file in chunks of fixed-width records.
+
+    Steps are buffered as tuples and written chunkSize at a time, so recording costs about
+    a list append per step. Call record after every env step, or use it as a context manager.
+
+    With append an existing file is continued. Passing episode as well drops its records from
+    that episode on, for a training run resumed from an earlier checkpoint."""
+
+    def __init__(self, path, cooldownCount, chunkSize=65536, append=False, episode=None):
+        self.path = path
+        self.dtype = trajectoryDtype(cooldownCount)
+        self.chunkSize = chunkSize
+        self.pending = []
+        self.episode = 0
+        self.t = 0
+
+        if append and os.path.exists(path):
+            self.f = open(path, "r+b")
+            dtype, offset = _readHeader(self.f)
+            if dtype != self.dtype:
+                raise ValueError("%s holds records of a different dtype" % path)
+            # Drop a partial record left by a crash
+            self.count = (os.path.getsize(path) - offset) // self.dtype.itemsize
+            if self.count:
+                episodes = np.memmap(path, dtype=self.dtype, mode="r", offset=offset, shape=(self.count,))["episode"]
+                if episode is not None:
+                    self.count = int(np.searchsorted(episodes, episode))
+                self.episode = int(episodes[self.count - 1]) + 1 if self.count else 0
+                del episodes
+            self.f.truncate(offset + self.count * self.dtype.itemsize)
+            self.f.seek(0, os.SEEK_END)
+        else:
+            self.f = open(path, "wb")
+            self.count = 0
+            self.f.write(_header(self.dtype, 0))
+        # Numbered from episode even when there was no file to continue
+        if episode is not None:
+            self.episode = episode
+
+    def record(self, action, potency, state, timer, done):
+        """ Log one step from the state it left (a BLM state array), episodes are numbered by done """
+        values = state.tolist()
+        self.pending.append((self.episode, self.t, action, values[-1], values[-2], potency, timer, values[:-2]))
+        self.t += 1
+        if done:
+            self.episode += 1
+            self.t = 0
+        if len(self.pending) >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.f.write(np.array(self.pending, dtype=self.dtype).tobytes())
+            self.count += len(self.pending)
+            self.pending = []
+        # Keep the header count current so the file is always a loadable .npy
+        self.f.seek(0)
+        self.f.write(_header(self.dtype, self.count))
+        self.f.seek(0, os.SEEK_END)
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TrajectoryReader:
+    """Memory-maps a trajectory file, records and their fields are views into the file.
+
+    Works on files still being written or cut short, any partial record at the end is ignored."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            dtype, offset = _readHeader(f)
+        count = (os.path.getsize(path) - offset) // dtype.itemsize
+        self.records = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,)) if count else np.zeros(0, dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def field(self, name):
+        return self.records[name]
+
+    def episodeStarts(self):
+        """ Index of the first record of every episode """
+        episodes = self.records["episode"]
+        return np.flatnonzero(np.r_[True, episodes[1:] != episodes[:-1]]) if len(episodes) else np.zeros(0, dtype=np.int64)
+
+    def episode(self, i):
+        """ Records of the i-th episode in the file """
+        starts = self.episodeStarts()
+        end = starts[i + 1] if i + 1 < len(starts) else len(self.records)
+        return self.records[starts[i]:end]
@@ -0,0 +1,319 @@
+from __future__ import print_function
+from __future__ import division
+import argparse
+import time
+import numpy as np
+from . import BLM
+from .Metrics import nullPhase
+
+# Outcomes of an action from a skeleton state: cast (or Fire 4's wait outside Astral Fire)
+# when there is mana for it, blocked when there is not or it is on cooldown
+OK, BLOCKED = 0, 1
+
+def memoryEstimate(skeletonCount, manaLevels, actionCount):
+    """ Bytes to hold a built and solved MDP """
+    perSkeleton = 8 + actionCount * (4 + 2 * (4 + 4 + 4)) # key, mana threshold, next/reward/mana map per outcome
+    perState = 4 + 1 # value, policy
+    return skeletonCount * (perSkeleton + manaLevels * perState)
+
+class TabularMDP:
+    """BLM as a deterministic tabular MDP, for solving exactly by value iteration.
+
+    A state is a skeleton (timer, next mana tick, Astral/Umbral and cooldowns, with times
+    on a grid of quantum seconds) and a mana level. Only mana decides whether a cast goes
+    through, and what a step does to mana depends on the skeleton only through Astral/Umbral,
+    the ability and the number of mana ticks, so skeletons are enumerated by reachability
+    and every mana level is kept for each as a dense row.
+
+    Transitions are the sparse form of P[s, a, s'], one nonzero per (s, a): from skeleton i
+    with mana level m, action a leads to skeleton next[i, a, o] with mana level
+    manaMaps[manaMap[i, a, o], m] for a reward of reward[i, a, o], where the outcome o is
+    OK when levels[m] >= threshold[i, a] and BLOCKED otherwise. next is -1 when the step
+    ends the fight.
+
+    Cast times, the wait and the mana tick are rounded to the grid, so a quantum that
+    divides them all (0.05 for BLM) keeps the env's rules exact. manaQuantum > 1 rounds
+    the mana missing from full up to its multiples, a pessimistic approximation."""
+
+    def __init__(self, maxUmbralAstral=3, quantum=0.05, manaQuantum=1, maxTime=None):
+        self.env = BLM.BLM(maxUmbralAstral)
+        if maxTime is not None:
+            self.env.MAXTIME = maxTime
+        self.quantum = quantum
+        self.manaQuantum = manaQuantum
+        self.abilityCount = len(self.env.ABILITIES)
+
+        self.castUnits = np.round(self.env.BASECASTTIME / quantum).astype(np.int64)
+        self.waitUnits = int(round(0.75 / quantum))
+        self.tickUnits = int(round(self.env.manaTickTiming / quantum))
+        self.endUnits = int(round(self.env.MAXTIME / quantum))
+
+        # Skeleton columns: timer, next mana tick, Astral/Umbral + 3, cooldowns. The timer
+        # comes first so sorted keys are in timer order
+        maxTimer = self.endUnits + max(self.castUnits.max(), self.waitUnits)
+        self.dims = (maxTimer + 1, maxTimer + self.tickUnits + 1, 7) + tuple(int(c) + 1 for c in self.env.COOLDOWN)
+
+        # Mana levels, ascending, and the level of every mana value
+        mana = np.arange(self.env.maxMana + 1)
+        self.levels = np.unique(self.quantizeMana(mana))
+        self.levelOf = np.searchsorted(self.levels, self.quantizeMana(mana))
+
+        self.keys = None
+        self.start = None
+        self.manaMaps = None
+
+    def quantizeMana(self, mana):
+        """ Round the mana missing from full up to a multiple of manaQuantum, so full mana stays exact """
+        missing = self.env.maxMana - mana
+        return np.maximum(0, self.env.maxMana - (missing + self.manaQuantum - 1) // self.manaQuantum * self.manaQuantum)
+
+    def initialSkeleton(self):
+        start = [0, int(round((self.env.manaTickTiming - 0.1) / self.quantum)), 3]
+        return np.array([start + self.env.initialState[:self.abilityCount].tolist()], dtype=np.int64)
+
+    def encode(self, skeletons):
+        """ One int64 key per skeleton row """
+        return np.ravel_multi_index(skeletons.T, self.dims)
+
+    def _manaMap(self, column, ticks, action):
+        """ Id of the mana level map for ticks of regen in column, then action's cost (None for no cast) """
+        key = (column, ticks, action)
+        mapId = self._manaMapIds.get(key)
+        if mapId is None:
+            env = self.env
+            mana = self.levels.copy()
+            for tick in range(ticks):
+                mana = np.minimum(mana - env.REGEN[column], self.env.maxMana).astype(np.int64)
+            if action is not None:
+                # Below the cost this outcome never happens, keep the map in range anyway
+                mana = np.maximum(0, np.minimum(mana - env.MANACOST[action, column], self.env.maxMana)).astype(np.int64)
+            mapId = self._manaMapIds[key] = len(self._maps)
+            self._maps.append(self.levelOf[mana])
+        return mapId
+
+    def _step(self, skeletons, action, outcome):
+        """ Skeletons after action with the given outcome, as BLM._step would take it on the grid """
+        env = self.env
+        skeletons = skeletons.copy()
+        timer = skeletons[:, 0]
+        nextManaTick = skeletons[:, 1]
+        column = skeletons[:, 2]
+
+        blocked = np.full(len(skeletons), outcome == BLOCKED)
+        neutralFire4 = ~blocked & env.NEEDSASTRAL[action] & (column <= 3)
+        cast = ~blocked & ~neutralFire4
+
+        timer += np.where(cast, self.castUnits[action], self.waitUnits)
+
+        ticks = np.zeros(len(skeletons), dtype=np.int64)
+        ticking = ~neutralFire4 & (column <= 3) & (timer > nextManaTick)
+        while ticking.any():
+            nextManaTick[ticking] += self.tickUnits
+            ticks += ticking
+            ticking &= timer > nextManaTick
+
+        rewards = np.where(blocked, -100.0, np.where(cast, env.POTENCY[action, column], 0.0))
+        # Few distinct (column, ticks, cast) per call, build their maps once each
+        combos, inverse = np.unique((column * self.dims[1] + ticks) * 2 + cast, return_inverse=True)
+        mapIds = np.array([self._manaMap(int(c // 2 // self.dims[1]), int(c // 2 % self.dims[1]), action if c % 2 else None)
+                           for c in combos], dtype=np.int32)
+        column[cast] = env.NEXTASTRALUMBRAL[action, column[cast]] + 3
+
+        cooldowns = skeletons[cast, 3:]
+        cooldowns = np.where(cooldowns > 0, np.maximum(0, cooldowns - env.BASECASTTIME[action]), cooldowns)
+        cooldowns[:, action] = env.COOLDOWN[action]
+        skeletons[cast, 3:] = cooldowns
+
+        dones = timer >= self.endUnits
+        return skeletons, rewards, mapIds[inverse.ravel()], dones
+
+    def build(self, phase=nullPhase):
+        """Enumerate every skeleton reachable from a fresh fight, with its transitions.
+
+        Every step moves the timer forward, so skeletons are expanded a timer value at a
+        time: once the smallest pending timer is reached nothing can add to it."""
+        self._maps = []
+        self._manaMapIds = {}
+        pending = {0: [self.initialSkeleton()]}
+        keys, thresholds, successors, rewards, manaMaps = [], [], [], [], []
+        while pending:
+            timer = min(pending)
+            with phase("enumerate"):
+                skeletons = np.concatenate(pending.pop(timer))
+                skeletonKeys, first = np.unique(self.encode(skeletons), return_index=True)
+                skeletons = skeletons[first]
+
+            with phase("expand"):
+                count = len(skeletons)
+                threshold = np.full((count, self.abilityCount), np.inf, dtype=np.float32)
+                successorKeys = np.full((count, self.abilityCount, 2), -1, dtype=np.int64)
+                stepRewards = np.zeros((count, self.abilityCount, 2), dtype=np.float32)
+                stepMaps = np.zeros((count, self.abilityCount, 2), dtype=np.int32)
+                for action in range(self.abilityCount):
+                    ready = skeletons[:, 3 + action] <= 0
+                    threshold[ready, action] = self.env.MANACOST[action, skeletons[ready, 2]]
+                    # A blocked outcome is reachable on cooldown or when the cast costs mana
+                    for outcome, rows in ((OK, np.flatnonzero(ready)), (BLOCKED, np.flatnonzero(~ready | (threshold[:, action] > 0)))):
+                        nextSkeletons, stepRewards[rows, action, outcome], stepMaps[rows, action, outcome], dones = self._step(skeletons[rows], action, outcome)
+                        nextSkeletons = nextSkeletons[~dones]
+                        successorKeys[rows[~dones], action, outcome] = self.encode(nextSkeletons)
+                        for t in np.unique(nextSkeletons[:, 0]):
+                            pending.setdefault(int(t), []).append(nextSkeletons[nextSkeletons[:, 0] == t])
+
+            keys.append(skeletonKeys)
+            thresholds.append(threshold)
+            successors.append(successorKeys)
+            rewards.append(stepRewards)
+            manaMaps.append(stepMaps)
+
+        # Groups come out in timer order and the timer leads the key, so keys are already sorted
+        with phase("index"):
+            self.keys = np.concatenate(keys)
+            self.threshold = np.concatenate(thresholds)
+            self.reward = np.concatenate(rewards)
+            self.manaMap = np.concatenate(manaMaps)
+            successors = np.concatenate(successors)
+            self.next = np.where(successors >= 0, np.searchsorted(self.keys, successors), -1).astype(np.int32)
+            self.manaMaps = np.array(self._maps, dtype=np.int32)
+            self.start = int(np.searchsorted(self.keys, self.encode(self.initialSkeleton())[0]))
+            # Skeletons [groups[g], groups[g + 1]) share a timer value
+            timers = self.keys // int(np.prod(self.dims[1:]))
+            self.groups = np.flatnonzero(np.r_[True, timers[1:] != timers[:-1], True])
+        return self
+
+    def __len__(self):
+        """ Number of states, every mana level of every skeleton """
+        return len(self.keys) * len(self.levels)
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.keys, self.threshold, self.reward, self.manaMap, self.next, self.manaMaps))
+
+    def index(self, env):
+        """ Skeleton row and mana level of env's current state, the row is -1 when it is not in the table """
+        state = env.state
+        skeleton = [int(round(env.timer / self.quantum)), int(round(env.nextManaTick / self.quantum)), int(state[-1]) + 3]
+        level = self.levelOf[min(max(int(state[-2]), 0), self.env.maxMana)]
+        try:
+            key = self.encode(np.array([skeleton + state[:self.abilityCount].tolist()], dtype=np.int64))[0]
+        except ValueError:
+            return -1, level
+        i = int(np.searchsorted(self.keys, key))
+        return (i if i < len(self.keys) and self.keys[i] == key else -1), level
+
+def valueIteration(mdp, gamma=1.0, tolerance=0.0, maxIterations=None, phase=nullPhase):
+    """Optimal values and a greedy policy of a built TabularMDP, both indexed [skeleton, mana level].
+
+    Each sweep backs up V(s) = max_a reward[s, a] + gamma * V(next[s, a]) for all states
+    of one timer value at once, latest timer first (Gauss-Seidel order), until no value
+    moves by more than tolerance. Steps only move forward in time, so the first sweep
+    already converges and the second confirms it."""
+    skeletonCount = len(mdp.keys)
+    levels = mdp.levels[None]
+    # The extra row is the end of the fight
+    values = np.zeros((skeletonCount + 1, len(mdp.levels)), dtype=np.float32)
+    policy = np.zeros((skeletonCount, len(mdp.levels)), dtype=np.int8)
+    successors = np.where(mdp.next < 0, skeletonCount, mdp.next)
+    groups = mdp.groups
+
+    iterations = 0
+    while maxIterations is None or iterations < maxIterations:
+        change = 0.0
+        with phase("sweep"):
+            for g in range(len(groups) - 2, -1, -1):
+                rows = slice(groups[g], groups[g + 1])
+                best = np.full((groups[g + 1] - groups[g], len(mdp.levels)), -np.inf, dtype=np.float32)
+                bestAction = np.zeros(best.shape, dtype=np.int8)
+                for action in range(mdp.abilityCount):
+                    ok, blocked = (mdp.reward[rows, action, o, None] + gamma * values[successors[rows, action, o, None], mdp.manaMaps[mdp.manaMap[rows, action, o]]]
+                                   for o in (OK, BLOCKED))
+                    q = np.where(levels >= mdp.threshold[rows, action, None], ok, blocked)
+                    better = q > best
+                    best[better] = q[better]
+                    bestAction[better] = action
+                change = max(change, float(np.abs(best - values[rows]).max()))
+                values[rows] = best
+                policy[rows] = bestAction
+        iterations += 1
+        if change <= tolerance:
+            break
+    return values[:-1], policy, iterations
+
+class PolicyAgent:
+    """Plays a solved policy table in DQNBLM.run in place of the learning Agent.
+
+    The table is looked up by env's full state (including its timers), so it needs the env
+    being played. States missing from the table, e.g. from a coarse quantum, fall back to
+    the most potent castable ability."""
+
+    def __init__(self, mdp, policy, env):
+        self.mdp = mdp
+        self.policy = policy
+        self.env = env
+        self.steps = 0
+        self.replays = 0
+        self.epsilon = 0
+        self.metrics = None
+        self.misses = 0
+
+    def phase(self, name):
+        return nullPhase(name)
+
+    def act(self, s):
+        i, level = self.mdp.index(self.env)
+        if i >= 0:
+            return int(self.policy[i, level])
+        self.misses += 1
+        env = self.env
+        column = env.state[-1] + 3
+        castable = [a for a in range(len(env.ABILITIES)) if env.state[a] <= 0 and env.state[-2] >= env.MANACOST[a, column]
+                    and not (env.NEEDSASTRAL[a] and column <= 3)]
+        return max(castable or range(len(env.ABILITIES)), key=lambda a: env.POTENCY[a, column])
+
+    def observe(self, sample):
+        self.steps += 1
+
+    def replay(self):
+        pass
+
+def playPolicy(mdp, policy, env=None):
+    """ Potency, actions and table misses of one fight played by the policy on a BLM """
+    if env is None:
+        env = BLM.BLM(mdp.env.maxUmbralAstral, mdp.env.job)
+        env.MAXTIME = mdp.env.MAXTIME
+    agent = PolicyAgent(mdp, policy, env)
+    env._reset()
+    total, rotation = 0, []
+    while True:
+        action = agent.act(env.state)
+        state, reward, done, info = env._step(action)
+        total += reward
+        rotation.append(action)
+        if done:
+            return total, rotation, agent.misses
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve BLM exactly by value iteration over its reachable states")
+    parser.add_argument("maxUmbralAstral", type=int, nargs="?", default=3)
+    parser.add_argument("--quantum", type=float, default=0.05)
+    parser.add_argument("--mana-quantum", type=int, default=1)
+    parser.add_argument("--max-time", type=float, default=None)
+    parser.add_argument("--estimate", action="store_true", help="only enumerate skeletons and print the memory needed per quantization")
+    args = parser.parse_args()
+
+    if args.estimate:
+        for quantum in (0.25, 0.1, 0.05):
+            mdp = TabularMDP(args.maxUmbralAstral, quantum, 1, args.max_time).build()
+            for manaQuantum in (1, 4, 16):
+                levels = len(TabularMDP(args.maxUmbralAstral, quantum, manaQuantum, args.max_time).levels)
+                print("Quantum %.2fs, mana %d: %d skeletons x %d mana levels, %.1f MB" % (
+                    quantum, manaQuantum, len(mdp.keys), levels, memoryEstimate(len(mdp.keys), levels, mdp.abilityCount) / 2**20))
+    else:
+        startTime = time.time()
+        mdp = TabularMDP(args.maxUmbralAstral, args.quantum, args.mana_quantum, args.max_time).build()
+        buildTime = time.time() - startTime
+        values, policy, iterations = valueIteration(mdp)
+        potency, rotation, misses = playPolicy(mdp, policy)
+        print("Value: %d, played: %d" % (values[mdp.start, -1], potency))
+        print(", ".join(mdp.env.ABILITIES[a].name for a in rotation))
+        print({"states": len(mdp), "megabytes": memoryEstimate(len(mdp.keys), len(mdp.levels), mdp.abilityCount) / 2**20,
+               "iterations": iterations, "misses": misses, "buildSeconds": buildTime, "seconds": time.time() - startTime})
@@ -0,0 +1,4 @@
+"""Find highest DPS rotations in FFXIV: the BLM environment, DQN training and rotation search.
+
+Modules import cntk, gym and tensorforce only when they are used, so importing the package,
+BLM or the search tools stays cheap in worker processes."""
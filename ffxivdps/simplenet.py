@@ -61,5 +61,6 @@ def ffnet():
     print(' error rate on an unseen minibatch: {}'.format(avg_error))
     return last_avg_error, avg_error
 
-np.random.seed(98052)
-ffnet()
\ No newline at end of file
+if __name__ == "__main__":
+    np.random.seed(98052)
+    ffnet()
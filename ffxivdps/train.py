@@ -0,0 +1,37 @@
+from __future__ import print_function
+import argparse
+import json
+from . import DQNBLM
+
+def parseSettings(config=None, overrides=()):
+    """Hyperparameters from a JSON config file, then NAME=VALUE overrides.
+
+    Names are DQNBLM globals in any case, values are JSON where they parse and strings otherwise."""
+    settings = {}
+    if config is not None:
+        with open(config) as f:
+            settings.update((name.upper(), value) for name, value in json.load(f).items())
+    for override in overrides:
+        name, _, value = override.partition("=")
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        settings[name.upper()] = value
+    return settings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train a DQN agent on BLM")
+    parser.add_argument("--config", default=None, help="JSON file of hyperparameters, e.g. {\"batch_size\": 64}")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="NAME=VALUE", help="override one hyperparameter, repeatable")
+    DQNBLM.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        DQNBLM.configure(**parseSettings(args.config, args.overrides))
+    except ValueError as e:
+        parser.error(str(e))
+    DQNBLM.train(args.checkpoint, args.checkpoint_every, args.resume, args.model, args.trajectory, args.profile)
+
+if __name__ == "__main__":
+    main()